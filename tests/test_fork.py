@@ -0,0 +1,74 @@
+import io
+import copy
+import random
+import unittest
+import contextlib
+
+from thousandrooms.game import Game
+from thousandrooms.player import Player
+from thousandrooms.maps import Map
+from thousandrooms.store import Store
+from thousandrooms.item import Item
+
+class TestForkStore(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+        self.game = Game()
+        self.game.headless = True
+        self.game.player = Player("Test")
+        self.game.player.gp = 100000
+        self.game.map = Map(2, 5)
+        self.game.map.setPlayerPosition(0, -1, -1)
+        self.game.store = Store(5)
+        self.game.mode = "store"
+
+    def snapshot(self, source):
+        return sorted((item.uid, item.id, item.stack, item.equipped) for item in source.items)
+
+    def countStock(self, id):
+        return sum(item.stack for item in self.game.store.items if item.id == id)
+
+    def resolve(self, action, mode, filterValue, choices):
+        self.game.itemListOptions["mode"] = mode
+        self.game.itemListOptions["filter"] = filterValue
+        self.game.scriptedInput = list(choices)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.game.storeResolve(action)
+
+    def testSellLeavesFork(self):
+        potion = Item(5, None, ["usable"])
+        self.game.player.addItem(potion)
+        self.game.player.addItem(copy.copy(potion))
+        for item in list(self.game.store.items.getView("usable")):
+            if item.id == potion.id:
+                self.game.store.items.remove(item)
+        forked = self.game.fork()
+        playerItems = self.snapshot(forked.player)
+        storeItems = self.snapshot(forked.store)
+
+        self.resolve("S", "sell", "usable", ["1"])
+        self.resolve("S", "sell", "usable", ["1"])
+
+        self.assertEqual(self.snapshot(forked.player), playerItems)
+        self.assertEqual(self.snapshot(forked.store), storeItems)
+        self.assertFalse(self.game.player.items.hasKind("usable"))
+        self.assertEqual(self.countStock(potion.id), 2)
+
+    def testBuyLeavesFork(self):
+        self.game.player.slots["weapon"] = None
+        for item in list(self.game.player.items.getView("weapon")):
+            self.game.player.removeItem(item)
+        if not self.game.store.items.hasKind("weapon"):
+            self.game.store.addItem(Item(5, None, ["weapon"]))
+        forked = self.game.fork()
+        playerItems = self.snapshot(forked.player)
+        storeItems = self.snapshot(forked.store)
+
+        self.resolve("B", "buy", "weapon", ["1"])
+
+        self.assertEqual(self.snapshot(forked.player), playerItems)
+        self.assertEqual(self.snapshot(forked.store), storeItems)
+        self.assertTrue(self.game.player.slots["weapon"].equipped)
+
+if __name__ == "__main__":
+    unittest.main()
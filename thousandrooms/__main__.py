@@ -1,6 +1,10 @@
 import sys
 import os
 import json
+import time
+import signal
+import argparse
+import threading
 import dill as pickle
 
 from colored import fore, back, style
@@ -9,6 +13,16 @@ import colorama
 from .game import Game
 from .player import Player
 from .maps import Map
+from .save_stream import SaveStream
+from .save_writer import SaveWriter
+from .sampling import GeneratorMismatch
+from .replay import ActionLog, Replay
+from .spectate import SpectatorServer
+from .recording import SessionRecorder, RecordingPlayer
+from .session_host import SessionSupervisor
+from .memory_profile import MemoryProfiler
+from .analytics import AnalyticsSink
+from .data_registry import DataRegistry
 
 clear=lambda: os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -16,6 +30,9 @@ class Launcher:
     saveFilePath = os.path.join(os.path.abspath(os.path.dirname(__file__)), "save")
     saveListFilePath = os.path.join(saveFilePath, "saveList.json")
     game = None
+    recordPath = None
+    actionLog = None
+    memoryProfilePath = None
 
     def checkSavePath(self):
         if not os.path.exists(self.saveFilePath):
@@ -38,30 +55,21 @@ class Launcher:
         return out
 
     def deleteSave(self, saveId):
+        SaveWriter.updateListFile(self.saveListFilePath, { saveId: None })
         try:
-            with open(self.saveListFilePath, "r") as json_file:
-                saveList = json.load(json_file)
-        except:
-            return
-        
-        try:
-            del saveList[saveId]
-            with open(self.saveListFilePath, "w") as json_file:
-                json.dump(saveList, json_file)
             os.remove(os.path.join(self.saveFilePath, saveId))
-        except KeyError:
+        except OSError:
             pass
 
     def loadSave(self, load):
-        loadFile = open(os.path.join(self.saveFilePath, load["saveId"]), "r")  
-        load = json.load(loadFile)
-        return load
+        return SaveStream.load(os.path.join(self.saveFilePath, load["saveId"]))
 
     def printSaveList(self, saveList):
         for i, save in enumerate(saveList):
             print(f"{i + 1}) {save['name']}")
 
     def startNewGame(self):
+        seed = ActionLog.newSeed()
         self.game = Game()
         print("Choose a name:")
         name = input()
@@ -71,11 +79,28 @@ class Launcher:
         ironman = input()
         if len(ironman) > 0 and ironman[0].upper() == "I":
             self.game.ironman = True
+        if self.recordPath:
+            self.actionLog = ActionLog.record(self.game, seed)
         self.runGame()
 
     def runGame(self):
-        while not self.game.playerQuit and not self.game.restart:
-            self.game.nextTurn()
+        profiler = None
+        if self.memoryProfilePath:
+            profiler = MemoryProfiler(self.game)
+            profiler.start()
+        try:
+            while not self.game.playerQuit and not self.game.restart:
+                self.game.nextTurn()
+        finally:
+            # a restart replaces the game, so its queued saves are written first
+            self.game.flushSaves()
+            self.game.recordRun()
+            if profiler:
+                profiler.stop()
+                profiler.save(self.memoryProfilePath)
+            if self.actionLog:
+                self.actionLog.save(self.recordPath)
+                self.actionLog = None
 
     def startGame(self):
         clear()
@@ -101,12 +126,12 @@ class Launcher:
                             saveIndex = int(saveChoice) - 1
                             saveFile = saves[saveIndex]
                             load = self.loadSave(saveFile)
-                            self.game = Game()
-                            self.game.player = Player(load["player"]["name"], load["player"])
-                            self.game.player.loadItems(load["items"])
-                            for i in load["game"]:
-                                setattr(self.game, i, load["game"][i])
-                            self.game.map = Map(load["map"]["numFloors"], load["map"]["width"], load["map"])
+                            try:
+                                self.game = Game.fromSave(load)
+                            except GeneratorMismatch as e:
+                                print(e)
+                                saveFile = None
+                                continue
 
                             if self.game.ironman:
                                 self.deleteSave(self.game.saveId)
@@ -130,13 +155,105 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
 
+    parser = argparse.ArgumentParser(prog="thousandrooms")
+    parser.add_argument("--autosave", type=int, default=0, metavar="TURNS", help="autosave every TURNS turns (0 to disable)")
+    parser.add_argument("--compress", choices=SaveStream.getCompressions(), default="none", help="compression used when writing saves")
+    parser.add_argument("--full-saves", action="store_true", help="write every floor to saves instead of only the floors the player has reached")
+    parser.add_argument("--workers", type=int, default=0, metavar="N", help="generate dungeon floors in N worker processes")
+    parser.add_argument("--spectate", type=int, metavar="PORT", help="let others watch the game by connecting to PORT on localhost")
+    parser.add_argument("--archive", metavar="PATH", help="save a compressed, seekable recording of the screens shown to PATH")
+    parser.add_argument("--watch", metavar="PATH", help="scrub through a recording made with --archive")
+    parser.add_argument("--host", type=int, metavar="PORT", help="host games for network players on PORT")
+    parser.add_argument("--shards", type=int, default=0, metavar="N", help="worker processes used with --host (defaults to one per core)")
+    parser.add_argument("--memory-profile", metavar="PATH", help="trace memory per resolver and per subsystem, writing the report to PATH")
+    parser.add_argument("--analytics", metavar="PATH", help="add every finished run to the analytics database at PATH")
+    parser.add_argument("--stats", metavar="PATH", help="print aggregate statistics from an analytics database")
+    parser.add_argument("--data", metavar="DIR", help="load the monster and item tables from the CSVs in DIR, SIGUSR1 reloads them while running")
+    parser.add_argument("--record", metavar="PATH", help="record the seed and every input of a new game to PATH")
+    parser.add_argument("--replay", metavar="PATH", help="replay a recorded game headlessly and print its history")
+    options = parser.parse_args(args)
+    Game.autosaveInterval = options.autosave
+    Game.saveCompression = options.compress
+    Map.generationWorkers = options.workers
+    Game.seedOnlySaves = not options.full_saves
+
+    if options.stats:
+        sink = AnalyticsSink(options.stats)
+        sink.printReport()
+        sink.close()
+        return
+
+    if options.data:
+        try:
+            DataRegistry.reload(options.data)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"{fore.RED}Could not load balance tables: {e}{style.RESET}")
+            return
+        DataRegistry.dataPath = options.data
+
+    if options.replay:
+        startTime = time.perf_counter()
+        log = ActionLog.load(options.replay)
+        game = Replay.run(log)
+        elapsed = time.perf_counter() - startTime
+        game.player.printHistory(game.turn)
+        print(f"\n{style.DIM}Replayed {len(log.inputs)} inputs in {elapsed:.3f}s{style.RESET}")
+        return
+
+    if options.watch:
+        player = RecordingPlayer(options.watch)
+        try:
+            player.scrub()
+        finally:
+            player.close()
+        return
+
+    if options.host is not None:
+        supervisor = SessionSupervisor(options.host, options.shards, analyticsPath=options.analytics, dataPath=options.data)
+        supervisor.start()
+        if hasattr(signal, "SIGHUP"):
+            # SIGHUP restarts the workers one at a time, handing their players over as it goes
+            signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=supervisor.restartAll, daemon=True).start())
+        if hasattr(signal, "SIGUSR1"):
+            # SIGUSR1 swaps in edited balance tables without disconnecting anyone
+            signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=supervisor.reloadData, daemon=True).start())
+        supervisor.serveForever()
+        return
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: DataRegistry.reloadInBackground())
+
+    if options.analytics:
+        Game.analytics = AnalyticsSink(options.analytics)
+
+    if options.archive:
+        Game.addFrameListener(SessionRecorder(options.archive))
+
+    if options.spectate is not None:
+        spectators = SpectatorServer(port=options.spectate)
+        spectators.start()
+        Game.addFrameListener(spectators)
+        print(f"{style.DIM}Spectators can connect to 127.0.0.1:{spectators.port}{style.RESET}")
+
     launcher = Launcher()
-    while not launcher.game or not launcher.game.playerQuit:
-        launcher.startGame()
-    if launcher.game.playerQuit:
-        clear()
-        launcher.game.player.printHistory(launcher.game.turn)
-        print()
+    launcher.recordPath = options.record
+    launcher.memoryProfilePath = options.memory_profile
+    try:
+        while not launcher.game or not launcher.game.playerQuit:
+            launcher.startGame()
+        if launcher.game.playerQuit:
+            clear()
+            launcher.game.startFrame()
+            launcher.game.player.printHistory(launcher.game.turn)
+            print()
+    finally:
+        if launcher.game:
+            launcher.game.publishFrame()
+        for listener in Game.frameListeners:
+            listener.close()
+        Game.removeFrameListeners()
+        if Game.analytics:
+            Game.analytics.close()
 
 if __name__ == "__main__":
     colorama.init()
@@ -0,0 +1,165 @@
+import time
+import sqlite3
+import threading
+
+from colored import style
+
+from .utils import Utils
+
+class AnalyticsSink:
+    # finished runs go into SQLite so any number of games, hosts and simulations can append to one file
+    # and the aggregates run as indexed queries instead of parsing every record
+    batchSize = 500
+    counters = ["rest", "risky_win", "reckless", "run_away", "kills", "buy_item", "sell_item", "dmg_done", "dmg_taken"]
+    runColumns = ["finished", "source", "name", "outcome", "turns", "playerLevel", "dungeonLevel", "deepestFloor", "deathFloor", "killedBy", "killedByLevel", "hasIdol", "ironman", "epitaph"] + counters
+    schema = [
+        "CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, finished REAL, source TEXT, name TEXT, outcome TEXT, turns INTEGER, playerLevel INTEGER, dungeonLevel INTEGER, deepestFloor INTEGER, deathFloor INTEGER, killedBy TEXT, killedByLevel INTEGER, hasIdol INTEGER, ironman INTEGER, epitaph TEXT, "
+            + ", ".join(f"{counter} INTEGER" for counter in counters) + ")",
+        "CREATE TABLE IF NOT EXISTS floors (run INTEGER, floor INTEGER, arrived INTEGER, turns INTEGER)",
+        "CREATE TABLE IF NOT EXISTS levels (run INTEGER, level INTEGER, reached INTEGER, turns INTEGER)",
+        "CREATE INDEX IF NOT EXISTS runsOutcome ON runs (outcome, deathFloor)",
+        "CREATE INDEX IF NOT EXISTS runsKilledBy ON runs (killedBy)",
+        "CREATE INDEX IF NOT EXISTS floorsTurns ON floors (floor, turns)",
+        "CREATE INDEX IF NOT EXISTS levelsTurns ON levels (level, turns)"
+    ]
+
+    def __init__(self, path, batchSize = None):
+        self.path = path
+        self.batchSize = batchSize or AnalyticsSink.batchSize
+        self.pending = []
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            for statement in AnalyticsSink.schema:
+                self.db.execute(statement)
+
+    @staticmethod
+    def getOutcome(game):
+        if game.mode != "gameOver":
+            return "quit"
+        if game.player.hp <= 0:
+            return "killed"
+        return "won" if game.player.hasIdol else "fled"
+
+    @staticmethod
+    def getRecord(game, source = "", outcome = None):
+        history = game.player.history
+        floorTurns = history.get("floor_turns", [1])
+        levelTurns = history.get("level_turns", [1])
+        run = {
+            "finished": time.time(),
+            "source": source,
+            "name": game.player.name,
+            "outcome": outcome or AnalyticsSink.getOutcome(game),
+            "turns": game.turn,
+            "playerLevel": game.player.level,
+            "dungeonLevel": game.level,
+            "deepestFloor": len(floorTurns),
+            "deathFloor": history.get("death_floor"),
+            "killedBy": history.get("killed_by"),
+            "killedByLevel": history.get("killed_by_level"),
+            "hasIdol": int(game.player.hasIdol),
+            "ironman": int(game.ironman),
+            "epitaph": history.get("epitaph")
+        }
+        for counter in AnalyticsSink.counters:
+            run[counter] = history.get(counter, 0)
+        if run["outcome"] != "killed":
+            run["deathFloor"] = run["killedBy"] = run["killedByLevel"] = None
+
+        # time spent on a floor or at a level runs until the next one was reached, or until the run ended
+        floors = [(f + 1, turn, (floorTurns[f + 1] if f + 1 < len(floorTurns) else game.turn) - turn) for f, turn in enumerate(floorTurns)]
+        levels = [(l + 1, turn, (levelTurns[l + 1] if l + 1 < len(levelTurns) else game.turn) - turn) for l, turn in enumerate(levelTurns)]
+        return (run, floors, levels)
+
+    def recordGame(self, game, source = "", outcome = None):
+        with self.lock:
+            self.pending.append(AnalyticsSink.getRecord(game, source, outcome))
+            full = len(self.pending) >= self.batchSize
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = []
+            if len(pending) == 0:
+                return
+            insertRun = f"INSERT INTO runs ({', '.join(AnalyticsSink.runColumns)}) VALUES ({', '.join('?' * len(AnalyticsSink.runColumns))})"
+            with self.db:
+                for run, floors, levels in pending:
+                    runId = self.db.execute(insertRun, [run[column] for column in AnalyticsSink.runColumns]).lastrowid
+                    self.db.executemany("INSERT INTO floors VALUES (?, ?, ?, ?)", [(runId,) + floor for floor in floors])
+                    self.db.executemany("INSERT INTO levels VALUES (?, ?, ?, ?)", [(runId,) + level for level in levels])
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
+
+    def query(self, sql, params = ()):
+        self.flush()
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def getSummary(self):
+        return { outcome: count for outcome, count in self.query("SELECT outcome, COUNT(*) FROM runs GROUP BY outcome") }
+
+    def getDeathRateByFloor(self):
+        # of the runs that reached a floor, how many died on it
+        return self.query("""
+            SELECT floors.floor, COUNT(*), COALESCE(deaths.count, 0), COALESCE(deaths.count, 0) * 1.0 / COUNT(*)
+            FROM floors LEFT JOIN (SELECT deathFloor AS floor, COUNT(*) AS count FROM runs WHERE outcome = 'killed' GROUP BY deathFloor) AS deaths
+            ON deaths.floor = floors.floor
+            GROUP BY floors.floor ORDER BY floors.floor
+        """)
+
+    def getDeathsByMonster(self, limit = 20):
+        return self.query("""
+            SELECT killedBy, COUNT(*), COUNT(*) * 1.0 / (SELECT COUNT(*) FROM runs WHERE outcome = 'killed'), AVG(deathFloor)
+            FROM runs WHERE outcome = 'killed'
+            GROUP BY killedBy ORDER BY COUNT(*) DESC LIMIT ?
+        """, (limit,))
+
+    def getMedianTurns(self, table):
+        # the middle row (or the mean of the two middle rows) of each group, read off the (group, turns) index
+        key = "floor" if table == "floors" else "level"
+        return self.query(f"""
+            SELECT {key}, AVG(turns), MAX(n) FROM (
+                SELECT {key}, turns, ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY turns) AS r, COUNT(*) OVER (PARTITION BY {key}) AS n
+                FROM {table}
+            ) WHERE r IN ((n + 1) / 2, (n + 2) / 2)
+            GROUP BY {key} ORDER BY {key}
+        """)
+
+    def getMedianTurnsPerFloor(self):
+        return self.getMedianTurns("floors")
+
+    def getMedianTurnsPerLevel(self):
+        return self.getMedianTurns("levels")
+
+    def printReport(self):
+        summary = self.getSummary()
+        print(f"{style.BOLD}Runs: {sum(summary.values())}{style.RESET} " + ", ".join(f"{outcome} {count}" for outcome, count in sorted(summary.items())))
+
+        print(f"\n{style.BOLD}Death rate by floor{style.RESET}")
+        Utils.printTable(["Floor", "Reached", "Deaths", "Rate"], [
+            { "floor": f"{floor}", "reached": f"{reached}", "deaths": f"{deaths}", "rate": f"{rate:.1%}" }
+            for floor, reached, deaths, rate in self.getDeathRateByFloor()
+        ], [8, 12, 12, 10])
+
+        print(f"\n{style.BOLD}Deaths by monster{style.RESET}")
+        Utils.printTable(["Monster", "Deaths", "Share", "Avg Floor"], [
+            { "monster": f"{monster}", "deaths": f"{deaths}", "share": f"{share:.1%}", "floor": f"{floor:.1f}" }
+            for monster, deaths, share, floor in self.getDeathsByMonster()
+        ], [28, 10, 10, 10])
+
+        print(f"\n{style.BOLD}Median turns{style.RESET}")
+        perFloor = { floor: median for floor, median, count in self.getMedianTurnsPerFloor() }
+        perLevel = { level: median for level, median, count in self.getMedianTurnsPerLevel() }
+        Utils.printTable(["", "On Floor", "At Level"], [
+            { "n": f"{n}", "floor": f"{perFloor[n]:g}" if n in perFloor else "", "level": f"{perLevel[n]:g}" if n in perLevel else "" }
+            for n in sorted(set(perFloor) | set(perLevel))
+        ], [8, 12, 12])
@@ -0,0 +1,173 @@
+import math
+import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class CombatOdds:
+    chargeChance = 1 / 10
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def diceDistribution(level, atk):
+        # exact distribution of d(level) + d(level) + d(atk), indexed by the total
+        dist = [1.0]
+        for size in [level, level, atk]:
+            dist = CombatOdds.convolve(dist, [0.0] + [1 / size] * size)
+        return tuple(dist)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def hitChance(atk, ac, bonus = 0, autoHit = True):
+        # the game lets an attack roll that totals exactly 20 hit regardless of ac
+        hits = 0
+        for roll in range(1, 21):
+            atkRoll = roll + atk + bonus
+            if (autoHit and atkRoll == 20) or atkRoll >= ac:
+                hits += 1
+        return hits / 20
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def attackDistribution(level, atk, ac, damageMode = "normal", bonus = 0, autoHit = True):
+        # damage dealt by a single attack, with misses counted as 0
+        hit = CombatOdds.hitChance(atk, ac, bonus, autoHit)
+        dice = CombatOdds.diceDistribution(level, atk)
+        out = [0.0] * (len(dice) * 2)
+        out[0] = 1 - hit
+        for value, p in enumerate(dice):
+            if damageMode == "vulnerable":
+                value = value * 2
+            elif damageMode == "resist":
+                value = value // 2
+            out[value] += p * hit
+        while len(out) > 1 and out[-1] == 0:
+            out.pop()
+        return tuple(out)
+
+    @staticmethod
+    def getDamageMode(creature, atkType):
+        # same rules as Creature.damage: vulnerability wins over resistance
+        mode = "normal"
+        try:
+            if atkType in creature.resist:
+                mode = "resist"
+        except AttributeError:
+            pass
+        try:
+            if creature.vulnerability == atkType:
+                mode = "vulnerable"
+        except AttributeError:
+            pass
+        return mode
+
+    @staticmethod
+    def getAtkType(creature):
+        return creature.atkType if type(creature).__name__ == "Player" else creature.atk_type
+
+    @staticmethod
+    def getAttackDistribution(attacker, defender, defending = False):
+        ac = defender.ac * 2 - 10 if defending else defender.ac
+        damageMode = CombatOdds.getDamageMode(defender, CombatOdds.getAtkType(attacker))
+        return CombatOdds.attackDistribution(attacker.level, attacker.atk, ac, damageMode)
+
+    @staticmethod
+    def getSpecialDistribution(monster, player, defending = False):
+        # only monsters without a named special deal hp damage with their charged attack
+        if monster.special:
+            return (1.0,)
+        ac = player.ac * 2 - 10 if defending else player.ac
+        damageMode = CombatOdds.getDamageMode(player, monster.atk_type)
+        return CombatOdds.attackDistribution(monster.level, monster.atk, ac, damageMode, int(math.sqrt(monster.level)), False)
+
+    @staticmethod
+    def expectedDamage(attacker, defender, defending = False):
+        dist = CombatOdds.getAttackDistribution(attacker, defender, defending)
+        return sum(value * p for value, p in enumerate(dist))
+
+    @staticmethod
+    def convolve(a, b):
+        if numpy:
+            return numpy.convolve(a, b).tolist()
+        out = [0.0] * (len(a) + len(b) - 1)
+        for i, p in enumerate(a):
+            if p > 0:
+                for j, q in enumerate(b):
+                    out[i + j] += p * q
+        return out
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def killChances(hp, dist, rounds):
+        # chance that the running total of attacks has reached hp, after each round
+        alive = [1.0] + [0.0] * (hp - 1)
+        dead = 0.0
+        out = [dead]
+        for r in range(rounds):
+            total = CombatOdds.convolve(alive, dist)
+            alive = total[:hp]
+            dead += sum(total[hp:])
+            out.append(dead)
+        return tuple(out)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def monsterKillChances(hp, dist, specialDist, charges, chargeRate, rounds):
+        # a monster with no charges readies an attack 1 time in 10 instead of attacking,
+        # and on its next turn every charge adds a special attack
+        turnDists = {}
+        for charged in set([0, charges, chargeRate]):
+            turnDists[charged] = dist
+            for c in range(charged):
+                turnDists[charged] = CombatOdds.convolve(turnDists[charged], specialDist)
+
+        states = { charges: [1.0] + [0.0] * (hp - 1) }
+        dead = 0.0
+        out = [dead]
+        for r in range(rounds):
+            nextStates = { 0: [0.0] * hp }
+            for charged, alive in states.items():
+                if charged == 0:
+                    nextStates[chargeRate] = [p * CombatOdds.chargeChance for p in alive]
+                    alive = [p * (1 - CombatOdds.chargeChance) for p in alive]
+                total = CombatOdds.convolve(alive, turnDists[charged])
+                nextStates[0] = [p + q for p, q in zip(nextStates[0], total)]
+                dead += sum(total[hp:])
+            states = nextStates
+            out.append(dead)
+        return tuple(out)
+
+    @staticmethod
+    def fightOdds(player, monster, rounds = 10):
+        # chances of each outcome if the player attacks every round for up to rounds rounds
+        kill = CombatOdds.killChances(max(monster.hp, 1), CombatOdds.getAttackDistribution(player, monster), rounds)
+        die = CombatOdds.monsterKillChances(
+            max(player.hp, 1),
+            CombatOdds.getAttackDistribution(monster, player),
+            CombatOdds.getSpecialDistribution(monster, player),
+            monster.charges,
+            monster.chargeRate,
+            rounds
+        )
+
+        # the player strikes first, the monster only answers if it survived
+        win = 0.0
+        lose = 0.0
+        for r in range(1, rounds + 1):
+            win += (kill[r] - kill[r - 1]) * (1 - die[r - 1])
+            lose += (1 - kill[r]) * (die[r] - die[r - 1])
+        return {
+            "win": win,
+            "lose": lose,
+            "ongoing": max(0.0, 1 - win - lose)
+        }
+
+    @staticmethod
+    def fightValue(player, monster, rounds = 10, deathCost = None):
+        # expected xp from fighting compared to running away, which gains and risks nothing
+        if deathCost is None:
+            deathCost = player.xp
+        odds = CombatOdds.fightOdds(player, monster, rounds)
+        return odds["win"] * monster.level * 50 - odds["lose"] * deathCost
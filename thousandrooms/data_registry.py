@@ -0,0 +1,112 @@
+import os
+import csv
+import weakref
+import threading
+
+from .monster_list import MonsterList
+from .item_list import ItemList
+
+class DataVersion:
+    def __init__(self, number, monsters, items):
+        self.number = number
+        self.monsters = monsters
+        self.items = items
+        # built from the tables by MonsterTemplate, Monster and Item, lazily or when the version is warmed
+        self.templates = None
+        self.monsterSamplers = {}
+        self.itemSamplers = {}
+        # monsters spawned from this version, it is kept for as long as any of them are
+        self.liveMonsters = weakref.WeakSet()
+
+class DataRegistry:
+    # a reload builds and warms a whole new version beside the live one, then swaps it in with one assignment,
+    # spawns read the current version once and monsters keep the version they were spawned from
+    dataPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+    monsterColumns = ["id", "name", "level", "hd", "atk", "ac", "type", "subtype", "atk_type", "resist", "vulnerability", "special"]
+    itemColumns = ["id", "kind", "name", "level", "ac", "atk", "type", "ability", "effect"]
+    current = DataVersion(0, MonsterList.monsters, ItemList.items)
+    versions = { 0: current }
+    warmers = []
+    lock = threading.Lock()
+
+    @staticmethod
+    def get(number = None):
+        if number is None:
+            return DataRegistry.current
+        return DataRegistry.versions[number]
+
+    @staticmethod
+    def addWarmer(warmer):
+        DataRegistry.warmers.append(warmer)
+
+    @staticmethod
+    def parseValue(value):
+        if value is None:
+            return ""
+        try:
+            return int(value)
+        except ValueError:
+            return value
+
+    @staticmethod
+    def readTable(path, columns, numbers):
+        with open(path, newline="") as tableFile:
+            reader = csv.DictReader(tableFile)
+            missing = [column for column in columns if column not in (reader.fieldnames or [])]
+            if len(missing) > 0:
+                raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+            table = []
+            for row in reader:
+                entry = { key: DataRegistry.parseValue(value) for key, value in row.items() if key is not None }
+                for column in numbers:
+                    if type(entry[column]) is not int:
+                        raise ValueError(f"{path} line {reader.line_num}: {column} is not a number")
+                table.append(entry)
+        if len(table) == 0:
+            raise ValueError(f"{path} has no rows")
+        return table
+
+    @staticmethod
+    def load(path = None):
+        path = path or DataRegistry.dataPath
+        monsters = DataRegistry.readTable(os.path.join(path, "monster_list.csv"), DataRegistry.monsterColumns, ["id", "level", "hd", "atk", "ac"])
+        items = DataRegistry.readTable(os.path.join(path, "item_list.csv"), DataRegistry.itemColumns, ["id", "level"])
+        return (monsters, items)
+
+    @staticmethod
+    def reload(path = None):
+        # raises on a bad table, leaving the live version untouched
+        with DataRegistry.lock:
+            monsters, items = DataRegistry.load(path)
+            previous = DataRegistry.current
+            version = DataVersion(previous.number + 1, monsters, items)
+
+            # the caches the live version has built so far are the ones sessions need, so build them all before the swap
+            for warmer in DataRegistry.warmers:
+                warmer(version, previous)
+
+            DataRegistry.versions[version.number] = version
+            DataRegistry.current = version
+            MonsterList.monsters = monsters
+            ItemList.items = items
+            DataRegistry.prune(previous)
+            return version
+
+    @staticmethod
+    def prune(previous):
+        # the version just replaced can still be mid-spawn, so it is only dropped by a later reload
+        for number, version in list(DataRegistry.versions.items()):
+            if version is not DataRegistry.current and version is not previous and len(version.liveMonsters) == 0:
+                del DataRegistry.versions[number]
+
+    @staticmethod
+    def reloadInBackground(path = None, onError = None):
+        def run():
+            try:
+                DataRegistry.reload(path)
+            except (OSError, ValueError, KeyError) as e:
+                if onError:
+                    onError(e)
+        thread = threading.Thread(target=run, name="DataReload", daemon=True)
+        thread.start()
+        return thread
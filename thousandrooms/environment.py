@@ -0,0 +1,179 @@
+import io
+import re
+import random
+import contextlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .game import Game
+from .player import Player
+from .maps import Map
+
+class VectorEnvironment:
+    # (mode the action belongs to, option letter) - "map" actions are also offered in peace
+    actions = [
+        ("combat", "A"),
+        ("combat", "D"),
+        ("combat", "X"),
+        ("combat", "R"),
+        ("peace", "R"),
+        ("map", "N"),
+        ("map", "S"),
+        ("map", "E"),
+        ("map", "W"),
+        ("map", "U"),
+        ("map", "D"),
+        ("map", "L"),
+        ("item", "healing")
+    ]
+    directions = ["n", "s", "e", "w", "up", "down"]
+    itemKinds = ["weapon", "armor", "ring", "usable"]
+    observationSize = 14 + 10 + 6 + 7
+
+    def __init__(self, numEnvs, maxSteps = 5000, numFloors = 10, width = 10):
+        if not numpy:
+            raise ImportError("VectorEnvironment requires the numpy package")
+        self.numEnvs = numEnvs
+        self.maxSteps = maxSteps
+        self.numFloors = numFloors
+        self.width = width
+        self.games = [None] * numEnvs
+        self.steps = [0] * numEnvs
+        self.seed = None
+        self.episodes = 0
+
+    def reset(self, seed = None):
+        self.seed = seed
+        self.episodes = 0
+        if seed is not None:
+            random.seed(seed)
+        for i in range(self.numEnvs):
+            self.resetGame(i)
+        return self.getObservations(), { "actionMask": self.getActionMasks() }
+
+    def resetGame(self, i):
+        with contextlib.redirect_stdout(io.StringIO()):
+            game = Game()
+            game.autosaveInterval = 0
+            game.scriptedInput = []
+            game.player = Player(f"Agent {i}")
+            game.map = Map(self.numFloors, self.width)
+        self.games[i] = game
+        self.steps[i] = 0
+        self.episodes += 1
+
+    def step(self, actions):
+        rewards = numpy.zeros(self.numEnvs, dtype=numpy.float32)
+        terminated = numpy.zeros(self.numEnvs, dtype=bool)
+        truncated = numpy.zeros(self.numEnvs, dtype=bool)
+        finalObservations = {}
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i, action in enumerate(actions):
+                game = self.games[i]
+                xp = game.player.xp
+                self.resolveAction(game, int(action))
+                self.steps[i] += 1
+
+                rewards[i] = (game.player.xp - xp) / 100
+                if game.mode == "gameOver":
+                    terminated[i] = True
+                    rewards[i] += 10 if game.player.hasIdol and game.player.hp > 0 else -10 if game.player.hp <= 0 else 0
+                elif self.steps[i] >= self.maxSteps:
+                    truncated[i] = True
+
+        for i in range(self.numEnvs):
+            if terminated[i] or truncated[i]:
+                self.games[i].recordRun("env", None if terminated[i] else "truncated")
+                finalObservations[i] = self.getObservation(self.games[i])
+                self.resetGame(i)
+
+        infos = { "actionMask": self.getActionMasks(), "finalObservation": finalObservations }
+        return self.getObservations(), rewards, terminated, truncated, infos
+
+    def resolveAction(self, game, action):
+        if not self.getActionMask(game)[action]:
+            return
+        game.clearResolution()
+        mode, letter = VectorEnvironment.actions[action]
+        if mode == "item":
+            item = VectorEnvironment.findItem(game, letter)
+            if game.resolveItem(item, game.mode):
+                game.player.removeItem(item)
+        elif mode == "map":
+            game.mode = "map"
+            if letter == "U" and game.map.playerPosition[0] == 0:
+                game.scriptedInput = ["y"]
+            game.mapResolve(letter)
+            game.scriptedInput = []
+            if game.mode == "map":
+                game.mode = "peace"
+        else:
+            game.resolver[mode](letter)
+
+    def getActionMasks(self):
+        return numpy.array([self.getActionMask(game) for game in self.games], dtype=bool)
+
+    def getActionMask(self, game):
+        mode = game.mode
+        offered = set(re.findall(r"<(\w)>", game.options[mode])) if mode in ["combat", "peace"] else set()
+        doors = { direction: door.isValid() for direction, door in game.map.getCurrentDoors() }
+
+        mask = []
+        for actionMode, letter in VectorEnvironment.actions:
+            if actionMode == "item":
+                valid = mode in ["combat", "peace"] and VectorEnvironment.findItem(game, letter) is not None
+            elif actionMode == "map":
+                valid = mode == "peace"
+                if letter == "U":
+                    # leaving the dungeon without the Idol just ends the run
+                    valid = valid and doors.get("up", False) and (game.map.playerPosition[0] > 0 or game.player.hasIdol)
+                elif letter == "D":
+                    valid = valid and doors.get("down", False)
+                elif letter != "L":
+                    valid = valid and doors.get(letter.lower(), False)
+            else:
+                valid = actionMode == mode and letter in offered
+            mask.append(valid)
+        return mask
+
+    @staticmethod
+    def findItem(game, effect):
+        for item in game.player.items.getView("usable"):
+            if item.effect == effect:
+                return item
+        return None
+
+    def getObservations(self):
+        return numpy.stack([self.getObservation(game) for game in self.games])
+
+    def getObservation(self, game):
+        player = game.player
+        pp = game.map.playerPosition
+        obs = [
+            player.level, player.hp, player.maxHp, player.atk, player.ac, player.xp, player.gp,
+            1 if player.hasIdol else 0, pp[0], pp[1], pp[2], game.turn, game.level, game.nextLevel - game.turn
+        ]
+
+        monster = game.monster
+        if monster:
+            lore = player.monsterLore.get(str(monster.id), {})
+            obs += [
+                1, monster.level, monster.hp, monster.maxHp, monster.atk, monster.ac, monster.charges,
+                1 if lore.get("resist") else 0, 1 if lore.get("vulnerability") else 0, 1 if lore.get("special") else 0
+            ]
+        else:
+            obs += [0] * 10
+
+        doors = { direction: door.isValid() for direction, door in game.map.getCurrentDoors() }
+        obs += [1 if doors.get(direction, False) else 0 for direction in VectorEnvironment.directions]
+
+        obs += [len(player.items.getView(kind)) for kind in VectorEnvironment.itemKinds]
+        weapon = player.slots["weapon"]
+        armor = player.slots["armor"]
+        healing = VectorEnvironment.findItem(game, "healing")
+        obs += [weapon.atk if weapon else 0, armor.ac if armor else 0, healing.stack if healing else 0]
+        return numpy.asarray(obs, dtype=numpy.float32)
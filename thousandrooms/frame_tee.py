@@ -0,0 +1,21 @@
+class FrameTee:
+    # passes terminal output through while keeping everything written since the screen was last cleared
+    def __init__(self, stream):
+        self.stream = stream
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def reset(self):
+        self.parts = []
+
+    def getFrame(self):
+        return "".join(self.parts)
@@ -17,6 +17,11 @@ from .maps import Map
 from .door import Door
 from .store import Store
 from .utils import Utils
+from .save_writer import SaveWriter
+from .sampling import BulkRandom
+from .combat_odds import CombatOdds
+from .prefetch import Prefetcher
+from .frame_tee import FrameTee
 
 clear=lambda: os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -25,6 +30,12 @@ class Game:
     saveListFilePath = os.path.join(saveFilePath, "saveList.json")
     playerQuit = False
     restart = False
+    autosaveInterval = 0
+    saveCompression = "none"
+    seedOnlySaves = True
+    frameTee = None
+    frameListeners = []
+    analytics = None
 
     def __init__(self):
         self.initialize()
@@ -38,6 +49,14 @@ class Game:
         self.level = 1
         self.ironman = False
         self.saveId = ""
+        self.lastAutosave = 0
+        self.saveWriter = SaveWriter()
+        self.scriptedInput = None
+        self.actionLog = None
+        self.headless = False
+        self.inputReader = None
+        self.runRecorded = False
+        self.prefetcher = Prefetcher()
 
         self.player = None
         self.monster = None
@@ -109,12 +128,47 @@ class Game:
 
     def incrementTurn(self, numTurns = 1):
         self.turn += numTurns
+        self.player.trackProgress(self.map.playerPosition[0], self.turn)
         if self.turn >= self.nextLevel:
             self.incrementDungeonLevel()
             self.addResolution(f"{fore.RED}The dungeon seems more dangerous...")
     
 ### PRINTING METHODS ###
 
+    @staticmethod
+    def addFrameListener(listener):
+        # the terminal still gets every print, the tee only remembers the current screen for listeners
+        if not Game.frameTee:
+            Game.frameTee = FrameTee(sys.stdout)
+            sys.stdout = Game.frameTee
+        Game.frameListeners.append(listener)
+
+    @staticmethod
+    def removeFrameListeners():
+        Game.frameListeners = []
+        if Game.frameTee and sys.stdout is Game.frameTee:
+            sys.stdout = Game.frameTee.stream
+        Game.frameTee = None
+
+    def clearScreen(self):
+        # os clear only reaches the host's terminal, hosted sessions send the escape code instead
+        if self.inputReader:
+            sys.stdout.write("\033[2J\033[H")
+        else:
+            clear()
+        self.startFrame()
+
+    def startFrame(self):
+        if self.frameTee:
+            self.frameTee.reset()
+
+    def publishFrame(self):
+        # every listener gets the same copy of the screen the player is looking at
+        if self.frameTee:
+            frame = self.frameTee.getFrame()
+            for listener in self.frameListeners:
+                listener.publish(frame, self.turn)
+
     def printRoll(self, roll, target):
         self.addResolution(f"[{roll} vs {target}]")
         
@@ -141,7 +195,7 @@ class Game:
         self.printStatHeader()
         self.player.printStats()
         print("")
-        self.monster.printStats(self.player.monsterLore)
+        self.monster.printStats(self.player.monsterLore, CombatOdds.fightOdds(self.player, self.monster))
 
     def peaceDisplay(self):
         self.printStatHeader()
@@ -268,6 +322,7 @@ class Game:
                     sunderables = [item for item in self.player.items if item.kind in ["weapon", "armor"] and item.equipped]
                     item = random.choice(sunderables)
                     if item:
+                        item = self.player.ownItem(item)
                         self.addResolution(f"{fore.CHARTREUSE_1}It strikes your {item.displayName} and damages it!")
                         if item.kind == "weapon":
                             item.atk -= 1
@@ -306,6 +361,7 @@ class Game:
     def checkPlayerLevelUp(self):
         levelUp = self.player.checkLevelUp()
         if levelUp:
+            self.player.trackProgress(self.map.playerPosition[0], self.turn)
             if self.level < self.player.level:
                 self.incrementDungeonLevel()
             self.addResolution(f"{fore.YELLOW}You gained a level!")
@@ -378,7 +434,7 @@ class Game:
 
     def filterItems(self):
         print("Filter: <W>eapons, <A>rmor, <R>ings, <U>sable, <E>verything")
-        choice = input()
+        choice = self.readInput()
         filterValue = "all"
         if choice.lower() == "w":
             filterValue = "weapon"
@@ -395,7 +451,7 @@ class Game:
         sys.stdout.write(f"{prompt} {style.DIM}<Enter> to cancel {style.RESET}")
         complete = False
         while not complete:
-            itemNum = input()
+            itemNum = self.readInput()
             if itemNum == "":
                 return None
             else:
@@ -485,7 +541,7 @@ class Game:
             prompt += " <W>est"
         prompt += f"{style.DIM} <Enter> to cancel {style.RESET}"
         sys.stdout.write(prompt)
-        choice = input()
+        choice = self.readInput()
         if choice and choice in validDirs:
             teleport = {
                 "n": lambda: self.map.setPlayerPosition(pp[0], random.randint(0, pp[1] - 1), pp[2]),
@@ -509,7 +565,7 @@ class Game:
     def shoppingResolve(self):
         self.inititemListOptions()
         self.itemListOptions["mode"] = "buy"
-        self.store = Store(self.level)
+        self.store = self.prefetcher.takeStore(self.level)
         self.mode = "store"
         bonus = self.player.level * 10
         self.player.gp += bonus
@@ -556,7 +612,7 @@ class Game:
                 prompt += " <W>est"
         prompt += f"{style.DIM} <Enter> to cancel {style.RESET}"
         sys.stdout.write(prompt)
-        choice = input()
+        choice = self.readInput()
         if choice == "":
             return False
         choice = choice[0].lower()
@@ -592,7 +648,7 @@ class Game:
                 if key[0] == direction and door.isValid():
                     if direction == "u" and self.map.playerPosition[0] == 0:
                         print(f"{fore.MAGENTA}{style.BOLD}Are you sure you want to exit the dungeon? <Y>es or <N>o{style.RESET}")
-                        choice = input()
+                        choice = self.readInput()
                         if choice.lower() == "y":
                             self.mode = "gameOver"
                             epitaph = "Defeated the dungeon!" if self.player.hasIdol else "Fled the dungeon!"
@@ -605,7 +661,10 @@ class Game:
                         self.map.resetRooms()
                         return True
                     else:
-                        self.map.movePlayer(direction)
+                        if direction == "d":
+                            self.prefetcher.descend(self.map)
+                        else:
+                            self.map.movePlayer(direction)
                         door.useDoor()
                         if 'traveling' in self.player.abilities:
                             travelRoll = self.rollDie(10)
@@ -692,7 +751,7 @@ class Game:
                 return True
             self.inititemListOptions()
             self.itemListOptions["mode"] = "buy"
-            self.store = Store(self.level)
+            self.store = self.prefetcher.takeStore(self.level)
             self.mode = "store"
             timeToShop = (self.map.playerPosition[0] + 1) * (10 - self.player.getAbilityLevel('traveling'))
             self.itemListOptions["message"] = f"{style.DIM}This trip will take {timeToShop} turns..."
@@ -700,13 +759,13 @@ class Game:
         elif action == "S":
             self.createSave()
             print("<C>ontinue or <Q>uit?")
-            choice = input()
+            choice = self.readInput()
             if len(choice) > 0 and choice[0].upper() == "Q":
                 self.endGame()
         elif action == "Q":
             if not self.saveId:
                 print(f"{fore.RED}Quit without saving? {style.DIM}<Y>es or <N>o{style.RESET}")
-                choice = input()
+                choice = self.readInput()
                 if len(choice) > 0 and choice[0].upper() == "Y":
                     self.endGame()
             else:
@@ -737,7 +796,7 @@ class Game:
         elif action == "U":
             self.itemListOptions["currPage"] = 0
             self.itemListOptions["filter"] = "usable"
-            clear()
+            self.clearScreen()
             self.inventoryDisplay()
             item = self.selectItem(self.player, "\nUse which item?")
             if item:
@@ -761,8 +820,7 @@ class Game:
                         self.itemListOptions["message"] = f"{fore.CYAN}You bought the {item.displayName}!"
                         self.itemListOptions["currPage"] = 0
                         self.player.removeGold(price)
-                        self.store.removeItem(item)
-                        self.player.addItem(item)
+                        self.player.addItem(self.store.removeItem(item))
                     else:
                         self.itemListOptions["message"] = f"{fore.RED}You can't afford the {item.displayName}!"
         elif action == "S":
@@ -776,8 +834,7 @@ class Game:
                     self.itemListOptions["message"] = f"{fore.YELLOW}You sold your {item.displayName}!"
                     self.itemListOptions["currPage"] = 0
                     self.player.addGold(price)
-                    self.player.removeItem(item)
-                    self.store.addItem(item)
+                    self.store.addItem(self.player.removeItem(item))
         elif action == "P":
             self.itemListOptions["currPage"] -= 1
         elif action == "N":
@@ -790,58 +847,148 @@ class Game:
 
 ### LIFECYCLE METHODS ###
 
+    def readInput(self, action = False):
+        # headless drivers queue answers in scriptedInput instead of using the terminal
+        if self.scriptedInput is not None:
+            choice = self.scriptedInput.pop(0) if len(self.scriptedInput) > 0 else ""
+        elif self.inputReader:
+            # hosted sessions read from their connection, action is True at the main prompt of a turn
+            self.publishFrame()
+            choice = self.inputReader(action)
+        else:
+            self.publishFrame()
+            self.prefetcher.start(self)
+            choice = input()
+            self.prefetcher.settle()
+        if self.actionLog is not None:
+            self.actionLog.append(choice)
+        return choice
+
     def takeInput(self):
-        self.printOptions()
+        if not self.headless:
+            self.printOptions()
         resolved = False
         self.clearResolution()
-        action = input()
+        action = self.readInput(True)
         if len(action) > 0:
             action = action[0].upper()
         self.resolver[self.mode](action)
         
     def nextTurn(self):
         if not self.playerQuit:
-            clear()
-            self.printStats()
-            self.printResolution()
+            self.checkAutosave()
+            if not self.headless:
+                self.clearScreen()
+                self.printStats()
+                self.printResolution()
             self.takeInput()
 
+    def fork(self):
+        # floors, inventory and items are shared copy-on-write, so a fork only pays for what it changes
+        forked = Game()
+        for field in ["mode", "restart", "playerQuit", "turn", "nextLevel", "level", "ironman", "lastAutosave"]:
+            setattr(forked, field, getattr(self, field))
+        forked.autosaveInterval = 0
+        forked.itemListOptions = dict(self.itemListOptions)
+        forked.resolution = list(self.resolution)
+        forked.player = self.player.fork()
+        if self.store:
+            forked.store = copy.copy(self.store)
+            forked.store.items = self.store.items.fork()
+
+        monsterInRoom = self.monster is not None and self.monster is self.map.getCurrentRoom().monster
+        forked.map = self.map.fork()
+        if monsterInRoom:
+            forked.monster = forked.map.getCurrentRoom().monster
+        else:
+            forked.monster = copy.deepcopy(self.monster)
+        return forked
+
+    @staticmethod
+    def fromSave(load):
+        game = Game()
+        game.player = Player(load["player"]["name"], load["player"])
+        game.player.loadItems(load["items"])
+        for i in load["game"]:
+            setattr(game, i, load["game"][i])
+        # the save was written on this turn, so the next autosave is a full interval away
+        game.lastAutosave = game.turn
+        game.map = Map(load["map"]["numFloors"], load["map"]["width"], load["map"])
+        # the inventory remembers the mode it was opened from, a fight still needs its monster
+        inCombat = game.mode == "combat" or (game.mode == "inventory" and game.itemListOptions["mode"] == "combat")
+        if inCombat:
+            game.monster = game.map.getCurrentRoom().monster
+            if not game.monster:
+                game.mode = "peace"
+                game.itemListOptions["mode"] = "peace"
+        return game
+
     def startNewGame(self):
         print("Choose a name:")
-        name = input()
+        name = self.readInput()
         self.player = Player(name)
         self.map = Map()
 
+    def recordRun(self, source = "play", outcome = None):
+        # only runs that are over count, a game that was saved and quit can still be picked up
+        over = self.mode == "gameOver" or (self.playerQuit and not self.saveId)
+        if self.analytics and not self.runRecorded and (over or outcome):
+            self.runRecorded = True
+            self.analytics.recordGame(self, source, outcome)
+
     def endGame(self):
         self.playerQuit = True
+        self.flushSaves()
 
     def checkSavePath(self):
         if not os.path.exists(self.saveFilePath):
             os.makedirs(self.saveFilePath)
 
     def saveWorker(self, saveObj):
-        saveFile = open(os.path.join(self.saveFilePath, self.saveId), 'w')
-        json.dump(saveObj, saveFile)
+        self.saveWriter.write(os.path.join(self.saveFilePath, self.saveId), saveObj, self.saveCompression)
 
-    def createSave(self):
-        self.checkSavePath()
+    def flushSaves(self):
+        error = self.saveWriter.flush()
+        if error:
+            print(f"{fore.RED}Saving failed: {error}{style.RESET}")
+
+    def checkAutosave(self):
+        if self.autosaveInterval <= 0 or self.ironman or self.mode != "peace":
+            return
+        if self.turn - self.lastAutosave >= self.autosaveInterval:
+            self.createSave()
 
+    def createSave(self):
         if self.saveId:
             saveId = self.saveId 
         else:
             saveId = str(int(time.time()))
             self.saveId = saveId
+        self.lastAutosave = self.turn
+        if self.headless:
+            return
+        self.checkSavePath()
 
         sys.stdout.write(f"{style.DIM}.")
+        # untouched floors are left out and rebuilt from their seeds on load
+        mapData = dict(self.map.__dict__)
+        mapData["playerPosition"] = list(self.map.playerPosition)
+        mapData["floors"] = [copy.deepcopy(floor) if self.map.isTouched(f) or not self.seedOnlySaves else None for f, floor in enumerate(self.map.floors)]
+        if not self.seedOnlySaves:
+            mapData["floorSeeds"] = None
+        else:
+            mapData["generator"] = BulkRandom.kind
         saveObj = {
             "player": dict(copy.deepcopy(self.player).__dict__),
-            "map": dict(copy.deepcopy(self.map).__dict__),
+            "map": mapData,
             "game": {
                 "turn": self.turn,
                 "nextLevel": self.nextLevel,
                 "level": self.level,
                 "ironman": self.ironman,
-                "saveId": self.saveId
+                "saveId": self.saveId,
+                "mode": self.mode if self.mode in ["combat", "map", "inventory"] else "peace",
+                "itemListOptions": dict(self.itemListOptions)
             }
         }
 
@@ -852,6 +999,7 @@ class Game:
             sys.stdout.write(".")
             saveObj["items"].append(item.__dict__)
         del saveObj["player"]["items"]
+        del saveObj["player"]["slots"]
 
         # make map rooms serializable
         saveObj["map"]["rooms"] = {}
@@ -864,6 +1012,8 @@ class Game:
 
         sys.stdout.write(fore.GREEN)
         for f, floor in enumerate(saveObj["map"]["floors"]):
+            if floor is None:
+                continue
             sys.stdout.write(".")
             for r in range(self.map.width):
                 for c in range(self.map.width):
@@ -891,18 +1041,12 @@ class Game:
 
         sys.stdout.write(f"\n{style.RESET}")
         del saveObj["map"]["floors"]
+        del saveObj["map"]["ownedFloors"]
 
         self.saveWorker(saveObj)
 
-        try:
-            with open(self.saveListFilePath) as json_file:  
-                saveList = json.load(json_file)
-        except:
-            saveList = {}
-
-        saveList[saveId] = f"{self.player.name} ({self.player.level})"
+        listName = f"{self.player.name} ({self.player.level})"
         if self.ironman:
-            saveList[saveId] += f" {fore.STEEL_BLUE_3}[IRONMAN]{style.RESET}"
+            listName += f" {fore.STEEL_BLUE_3}[IRONMAN]{style.RESET}"
 
-        with open(self.saveListFilePath, 'w') as outfile:  
-            json.dump(saveList, outfile)
\ No newline at end of file
+        self.saveWriter.updateList(self.saveListFilePath, saveId, listName)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import copy
+
+class Inventory:
+    lastUid = 0
+
+    def __init__(self):
+        # dicts keyed by uid keep insertion order and give O(1) removal
+        self.items = {}
+        self.byKind = {}
+        self.byTemplate = {}
+        self.views = {}
+        self.shared = False
+        self.owned = set()
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return self.items.get(item.uid) is item
+
+    def __getitem__(self, index):
+        return self.getView()[index]
+
+    def add(self, item):
+        # an item taken in from elsewhere may still be shared with a fork, so it is not owned until own copies it
+        self.unshare()
+        try:
+            uid = item.uid
+        except AttributeError:
+            uid = 0
+        if uid in self.items:
+            item = copy.copy(item)
+            uid = 0
+        if uid == 0:
+            uid = Inventory.lastUid + 1
+            item.uid = uid
+        Inventory.lastUid = max(Inventory.lastUid, uid)
+
+        self.items[uid] = item
+        self.byKind.setdefault(item.kind, {})[uid] = item
+        self.byTemplate.setdefault(item.id, {})[uid] = item
+        self.views = {}
+        return item
+
+    def remove(self, item):
+        self.unshare()
+        del self.items[item.uid]
+        del self.byKind[item.kind][item.uid]
+        del self.byTemplate[item.id][item.uid]
+        self.owned.discard(item.uid)
+        self.views = {}
+
+    def stack(self, item):
+        # merge a usable item into an existing stack, returns False if there is none
+        invItem = next(iter(self.byTemplate.get(item.id, {}).values()), None)
+        if invItem is None:
+            return False
+        invItem = self.own(invItem)
+        invItem.stack += 1
+        return True
+
+    def hasKind(self, kind):
+        return len(self.byKind.get(kind, {})) > 0
+
+    def getByUid(self, uid):
+        return self.items.get(uid)
+
+    def getView(self, filterValue = "all"):
+        try:
+            return self.views[filterValue]
+        except KeyError:
+            if filterValue == "all":
+                view = list(self.items.values())
+            else:
+                view = list(self.byKind.get(filterValue, {}).values())
+            self.views[filterValue] = view
+            return view
+
+    def getPage(self, filterValue, page, pageSize):
+        key = (filterValue, page, pageSize)
+        try:
+            return self.views[key]
+        except KeyError:
+            startIndex = pageSize * page
+            view = self.getView(filterValue)[startIndex:startIndex + pageSize]
+            self.views[key] = view
+            return view
+
+    def fork(self):
+        # both sides share the indexes and items until one of them writes
+        forked = copy.copy(self)
+        self.shared = forked.shared = True
+        self.owned = set()
+        forked.owned = set()
+        return forked
+
+    def unshare(self):
+        if self.shared:
+            self.items = dict(self.items)
+            self.byKind = { kind: dict(items) for kind, items in self.byKind.items() }
+            self.byTemplate = { id: dict(items) for id, items in self.byTemplate.items() }
+            self.views = {}
+            self.shared = False
+
+    def own(self, item):
+        # return this inventory's private copy of item, which is safe to modify in place
+        current = self.items.get(item.uid)
+        if current is None or item.uid in self.owned:
+            return current if current is not None else item
+        self.unshare()
+        ownItem = copy.copy(current)
+        self.items[item.uid] = ownItem
+        self.byKind[item.kind][item.uid] = ownItem
+        self.byTemplate[item.id][item.uid] = ownItem
+        self.owned.add(item.uid)
+        self.views = {}
+        return ownItem
@@ -5,9 +5,11 @@ from colored import fore, back, style
 
 from .item_list import ItemList
 from .utils import Utils
+from .sampling import AliasTable
+from .data_registry import DataRegistry
 
 class Item:
-    def __init__(self, level, data = None, force = []):
+    def __init__(self, level, data = None, force = [], info = None):
         self.isEgo = False
         self.equipped = False
         self.kind = ''
@@ -21,9 +23,8 @@ class Item:
             for i in data:
                 setattr(self, i, data[i])
         else:
-            info = self.getItem(level)
-            while len(force) > 0 and (not info or info["kind"] not in force):
-                info = self.getItem(level // 2)
+            if not info:
+                info = Item.getSampler(level, force).sample()
             if info != None:
                 for i in info:
                     setattr(self, i, info[i])
@@ -67,6 +68,12 @@ class Item:
                     if egoChance <= level:
                         self.generateEgo()
 
+        if self.kind:
+            self.parseAbility()
+
+    def parseAbility(self):
+        self.resistType = self.ability.replace("resist_", "") if self.ability and "resist_" in self.ability else ""
+
     def generateEgo(self):
         self.isEgo = True
 
@@ -104,7 +111,7 @@ class Item:
             out += f"{self.atk}"
         if self.ac:
             out += f"{self.ac}"
-        if self.ability and not "resist_" in self.ability:
+        if self.ability and not self.resistType:
             ability = self.getAbilityLevel()
             out += f"{ability}" if out == "" else f"({ability})"
         return out
@@ -127,25 +134,84 @@ class Item:
 
     @staticmethod
     def getItem(level):
-        itemRoll = random.randint(level, 100)
-        kind = "none"
-        
-        if itemRoll < 80:
-            return None
-        if itemRoll < 88:
-            kind = "usable"
-        elif itemRoll < 93:
-            kind = "weapon"
-        elif itemRoll < 98:
-            kind = "armor"
-        else:
-            kind = "ring"
-    
-        if kind in ["usable", "ring"]:
-            items = [item for item in ItemList.items if item["kind"] == kind and item["level"] <= level] 
-        else:
-            items = [item for item in ItemList.items if item["kind"] == kind and item["level"] <= level and item["level"] > level - 8] 
-        return random.choice(items) if len(items) else None
+        return Item.getSampler(level).sample()
+
+    @staticmethod
+    def generateMany(level, n, kinds = []):
+        # n real items, drawn as if Item(level, None, kinds) were retried until it found one
+        try:
+            sampler = Item.getSampler(level, kinds, True)
+        except ValueError:
+            return []
+        return [Item(level, None, kinds, info) for info in sampler.sampleMany(n)]
+
+    @staticmethod
+    def getFoundChance(level):
+        return 1 - Item.getItemWeights(level).get(-1, 0)
+
+    @staticmethod
+    def getSampler(level, force = [], found = False, version = None):
+        version = version or DataRegistry.current
+        key = (level, tuple(force), found)
+        try:
+            return version.itemSamplers[key]
+        except KeyError:
+            pass
+
+        items = version.items
+        weights = Item.getItemWeights(level, items)
+        if len(force) > 0:
+            # a failed roll at this level is retried at half level until an allowed kind comes up
+            allowed = { i: w for i, w in weights.items() if i >= 0 and items[i]["kind"] in force }
+            retry = { i: w for i, w in Item.getItemWeights(level // 2, items).items() if i >= 0 and items[i]["kind"] in force }
+            retryTotal = sum(retry.values())
+            if retryTotal > 0:
+                failed = 1 - sum(allowed.values())
+                for i, w in retry.items():
+                    allowed[i] = allowed.get(i, 0) + failed * w / retryTotal
+            weights = allowed if len(allowed) > 0 else { -1: 1 }
+        if found:
+            weights = { i: w for i, w in weights.items() if i >= 0 }
+
+        outcomes = [items[i] if i >= 0 else None for i in weights]
+        sampler = AliasTable(outcomes, list(weights.values()))
+        version.itemSamplers[key] = sampler
+        return sampler
+
+    @staticmethod
+    def warmSamplers(version, previous):
+        for level, force, found in list(previous.itemSamplers):
+            Item.getSampler(level, list(force), found, version)
+
+    @staticmethod
+    def getItemWeights(level, items = None):
+        # exact probabilities of rolling d(level..100) for the kind, then picking uniformly
+        items = items or DataRegistry.current.items
+        weights = {}
+        lowRoll = min(level, 100)
+        rollChance = 1 / (101 - lowRoll)
+        for itemRoll in range(lowRoll, 101):
+            if itemRoll < 80:
+                kind = "none"
+            elif itemRoll < 88:
+                kind = "usable"
+            elif itemRoll < 93:
+                kind = "weapon"
+            elif itemRoll < 98:
+                kind = "armor"
+            else:
+                kind = "ring"
+
+            if kind in ["usable", "ring"]:
+                candidates = [i for i, item in enumerate(items) if item["kind"] == kind and item["level"] <= level]
+            else:
+                candidates = [i for i, item in enumerate(items) if item["kind"] == kind and item["level"] <= level and item["level"] > level - 8]
+
+            if len(candidates) == 0:
+                weights[-1] = weights.get(-1, 0) + rollChance
+            for i in candidates:
+                weights[i] = weights.get(i, 0) + rollChance / len(candidates)
+        return weights
 
     @staticmethod
     def getOptions(source, options):
@@ -168,8 +234,7 @@ class Item:
         elif sourceType == "Store":
             actions = ["<B>uy", "<S>ell"]
         
-        filteredItems = source.items if filterValue == "all" else list(filter(lambda i: i.kind == filterValue, source.items))
-        totalItems = len(filteredItems)
+        totalItems = len(source.items.getView(filterValue))
 
         navigation = []
         if page > 0:
@@ -200,11 +265,8 @@ class Item:
             print(f"{fore.MAGENTA}{style.BOLD}Store Inventory{filterHeader}{style.RESET}")
             valueFactor = options["buyFactor"]
 
-        filteredItems = source.items if filterValue == "all" else list(filter(lambda i: i.kind == filterValue, source.items))
-
         startIndex = pageSize * page
-        s = slice(startIndex, startIndex + pageSize)
-        pageItems = filteredItems[s]
+        pageItems = source.items.getPage(filterValue, page, pageSize)
         
         itemLines = []
         for i, item in enumerate(pageItems, 1):
@@ -226,9 +288,11 @@ class Item:
     def getFilteredItem(source, options, index):
         filterValue = options["filter"]
  
-        filteredItems = source.items if filterValue == "all" else list(filter(lambda i: i.kind == filterValue, source.items))
+        filteredItems = source.items.getView(filterValue)
 
         try:
             return filteredItems[index]
         except IndexError:
-            return None
\ No newline at end of file
+            return None
+
+DataRegistry.addWarmer(Item.warmSamplers)
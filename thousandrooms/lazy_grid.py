@@ -0,0 +1,22 @@
+from .room import Room
+from .door import Door
+
+class LazyGrid(dict):
+    # a floor's rooms or doors, built from packed values (arrays or nested lists) the first time each key is looked up
+    def __init__(self, kind, floorIndex, packed, rows, cols):
+        self.kind = kind
+        self.floorIndex = floorIndex
+        self.packed = packed
+        self.rows = rows
+        self.cols = cols
+
+    def __missing__(self, key):
+        r, c = key
+        if r < 0 or r >= self.rows or c < 0 or c >= self.cols:
+            raise KeyError(key)
+        if self.kind == "room":
+            item = Room((self.floorIndex, r, c), { "nameCode": int(self.packed[r][c]) })
+        else:
+            item = Door(self.kind, { "type": self.kind, "exists": bool(self.packed[r][c]), "seen": False, "used": False })
+        self[key] = item
+        return item
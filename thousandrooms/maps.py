@@ -1,35 +1,64 @@
 import random
 import copy
 import sys
+import shutil
+import concurrent.futures
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from colored import fore, back, style
 
 from .room import Room
 from .door import Door
+from .lazy_grid import LazyGrid
+from .sampling import BulkRandom
 
 class Map:
+    generationWorkers = 0
+
     def __init__(self, numFloors = 10, width = 10, data = None):
         self.floors = []
+        self.ownedFloors = set()
         self.width = width
         self.numFloors = numFloors
         self.dungeonLevel = 1 if not data else data["dungeonLevel"]
+        self.epoch = data.get("epoch", 0) if data else 0
+        self.floorSeeds = None
         self.message = ""
 
-        for f in range(numFloors):
-            floor = {
-                "rooms": {},
-                "doors": {
-                    "ew": {},
-                    "ns": {}
-                },
-                "stairs": {}
-            }
-
-            if data:
+        if data:
+            if data.get("floorSeeds"):
+                self.floorSeeds = [(seed, tuple(up), tuple(down)) for seed, up, down in data["floorSeeds"]]
+                if any(f"{f}-0-0" not in data["rooms"] for f in range(numFloors)):
+                    BulkRandom.checkKind(data.get("generator", BulkRandom.kind), "This save")
+            for f in range(numFloors):
+                if self.floorSeeds and f"{f}-0-0" not in data["rooms"]:
+                    # floors the player never reached are saved as their generation seed
+                    state = random.getstate()
+                    self.floors.append(Map.generateFloor(f, width, *self.floorSeeds[f]))
+                    random.setstate(state)
+                    self.ownedFloors.add(f)
+                    continue
+
+                floor = {
+                    "rooms": {},
+                    "doors": {
+                        "ew": {},
+                        "ns": {}
+                    },
+                    "stairs": {},
+                    "visited": set()
+                }
+
                 for r in range(width):
                     for c in range(width):
                         # generate rooms
                         floor["rooms"][(r,c)] = Room((f, r, c), data["rooms"][f"{f}-{r}-{c}"], data["monsters"][f"{f}-{r}-{c}"])
+                        if floor["rooms"][(r,c)].seen:
+                            floor["visited"].add((r,c))
                         # load east-west doors
                         if c < width - 1:
                             floor["doors"]["ew"][(r,c)] = Door("ew", data["doors"]["ew"][f"{f}-{r}-{c}"])
@@ -41,59 +70,11 @@ class Map:
                             floor["stairs"][(r,c)] = Door("stairs", data["stairs"][f"{f}-{r}-{c}"])
                         except KeyError:
                             pass
-            else:
-                for r in range(width):
-                    for c in range(width):
-                        # generate rooms
-                        floor["rooms"][(r,c)] = Room((f, r, c))
-                        # generate east-west doors
-                        if c < width - 1:
-                            floor["doors"]["ew"][(r,c)] = Door("ew")
-                        # generate north-south doors
-                        if r < width - 1:
-                            floor["doors"]["ns"][(r,c)] = Door("ns")
 
-                # connect rooms and doors
-                for r in range(width):
-                    for c in range(width):
-                        doorList = []
-                        if r > 0:
-                            doorList.append(floor["doors"]["ns"][(r-1,c)])
-                        if r < self.width - 1:
-                            doorList.append(floor["doors"]["ns"][(r,c)])
-                        if c > 0:
-                            doorList.append(floor["doors"]["ew"][(r,c-1)])
-                        if c < self.width - 1:
-                            doorList.append(floor["doors"]["ew"][(r,c)])
-
-                        # check for disconnected room and fix it
-                        connected = False
-                        for d in doorList:
-                            if d.exists:
-                                connected = True
-                        if not connected:
-                            random.choice(doorList).exists = True
-            
-                # generate stairs
-                up = (-1, -1)
-                if f > 0:
-                    for i, (key, stair) in enumerate(self.floors[f - 1]["stairs"].items()):
-                        if stair.stairDir == "down":
-                            up = key
-                            upStairs = copy.deepcopy(stair)
-                            upStairs.stairDir = "up"
-                            floor["stairs"][key] = upStairs
-                            floor["rooms"][key].stairs = "up"
-                if f < numFloors:
-                    down = (random.randint(0,self.width - 1), random.randint(0,self.width - 1))
-                    while down == up:
-                        down = (random.randint(0,self.width - 1), random.randint(0,self.width - 1))
-                    downStairs = Door("stairs")
-                    downStairs.stairDir = "down"
-                    floor["stairs"][down] = downStairs
-                    floor["rooms"][down].stairs = "down"
-
-            self.floors.append(floor)
+                self.floors.append(floor)
+                self.ownedFloors.add(f)
+        else:
+            self.generateFloors()
 
         if data:
             self.playerPosition = data["playerPosition"]
@@ -103,12 +84,152 @@ class Map:
             escapeStairs.stairDir = "up"
             self.floors[0]["stairs"][(self.playerPosition[1], self.playerPosition[2])] = escapeStairs
 
+    def generateFloors(self):
+        # stairs and one seed per floor come from the main stream first, so floors can be built in any order
+        stairs = []
+        up = (-1, -1)
+        for f in range(self.numFloors):
+            down = (random.randint(0,self.width - 1), random.randint(0,self.width - 1))
+            while down == up:
+                down = (random.randint(0,self.width - 1), random.randint(0,self.width - 1))
+            stairs.append((up, down))
+            up = down
+        seeds = [random.getrandbits(64) for f in range(self.numFloors)]
+        self.floorSeeds = [(seeds[f], up, down) for f, (up, down) in enumerate(stairs)]
+
+        floorArgs = ([f for f in range(self.numFloors)], [self.width] * self.numFloors, seeds, [up for up, down in stairs], [down for up, down in stairs])
+        if Map.generationWorkers > 1 and self.numFloors > 1:
+            with concurrent.futures.ProcessPoolExecutor(Map.generationWorkers) as pool:
+                floors = list(pool.map(Map.generateFloor, *floorArgs))
+        else:
+            state = random.getstate()
+            floors = list(map(Map.generateFloor, *floorArgs))
+            random.setstate(state)
+
+        for f, floor in enumerate(floors):
+            self.floors.append(floor)
+            self.ownedFloors.add(f)
+
+    @staticmethod
+    def generateFloor(f, width, seed, up, down):
+        random.seed(seed)
+        ns, ew = Map.generateDoors(width)
+        floor = {
+            "rooms": LazyGrid("room", f, Room.rollNameCodes(width, width), width, width),
+            "doors": {
+                "ew": LazyGrid("ew", f, ew, width, width - 1),
+                "ns": LazyGrid("ns", f, ns, width - 1, width)
+            },
+            "stairs": {},
+            "visited": set()
+        }
+
+        # place the stairs decided by generateFloors
+        if up != (-1, -1):
+            upStairs = Door("stairs")
+            upStairs.stairDir = "up"
+            floor["stairs"][up] = upStairs
+            floor["rooms"][up].stairs = "up"
+        downStairs = Door("stairs")
+        downStairs.stairDir = "down"
+        floor["stairs"][down] = downStairs
+        floor["rooms"][down].stairs = "down"
+        return floor
+
+    @staticmethod
+    def generateDoors(width):
+        # each door exists 2 times in 3, then every room left without a door gets one at random
+        if numpy:
+            generator = BulkRandom.generator()
+            ns = generator.random((width - 1, width)) < 2 / 3
+            ew = generator.random((width, width - 1)) < 2 / 3
+            doorCount = numpy.zeros((width, width), dtype=numpy.int64)
+            doorCount[1:, :] += ns
+            doorCount[:-1, :] += ns
+            doorCount[:, 1:] += ew
+            doorCount[:, :-1] += ew
+            isolated = numpy.argwhere(doorCount == 0).tolist()
+            picks = generator.random(len(isolated)).tolist()
+        else:
+            ns = [[random.random() < 2 / 3 for c in range(width)] for r in range(width - 1)]
+            ew = [[random.random() < 2 / 3 for c in range(width - 1)] for r in range(width)]
+            isolated = []
+            for r in range(width):
+                for c in range(width):
+                    if not ((r > 0 and ns[r-1][c]) or (r < width - 1 and ns[r][c]) or (c > 0 and ew[r][c-1]) or (c < width - 1 and ew[r][c])):
+                        isolated.append((r, c))
+            picks = [random.random() for room in isolated]
+
+        for (r, c), pick in zip(isolated, picks):
+            doorList = []
+            if r > 0:
+                doorList.append((ns, r-1, c))
+            if r < width - 1:
+                doorList.append((ns, r, c))
+            if c > 0:
+                doorList.append((ew, r, c-1))
+            if c < width - 1:
+                doorList.append((ew, r, c))
+            doors, dr, dc = doorList[int(pick * len(doorList))]
+            doors[dr][dc] = True
+
+        return ns, ew
+
+    def isTouched(self, f):
+        # a floor differs from its generated state only once the player has been on it
+        return self.floorSeeds is None or len(self.floors[f]["visited"]) > 0
+
+    def getFloor(self, f):
+        # for reading only, the floor may be shared with a forked map
+        return self.floors[f]
+
+    def ownFloor(self, f):
+        # floors shared with a forked map are copied before their first change
+        if f not in self.ownedFloors:
+            self.floors[f] = copy.deepcopy(self.floors[f])
+            self.ownedFloors.add(f)
+        return self.floors[f]
+
+    def fork(self):
+        # a map always owns the floor the player is on, so the game's references into it stay valid,
+        # the fork gets its own copy of that floor and every other floor is copied by whichever map changes it first
+        current = self.playerPosition[0]
+        forked = copy.copy(self)
+        forked.floors = list(self.floors)
+        forked.floors[current] = copy.deepcopy(self.floors[current])
+        forked.playerPosition = list(self.playerPosition)
+        forked.ownedFloors = set([current])
+        self.ownedFloors = set([current])
+        return forked
+
+    @staticmethod
+    def markVisited(floorData, row, col):
+        floorData["visited"].add((row, col))
+        for blockSize, blocks in floorData.get("visitedBlocks", {}).items():
+            blocks.add((row // blockSize, col // blockSize))
+
+    @staticmethod
+    def getVisitedBlocks(floorData, blockSize):
+        # the minimap's visited blocks are built once per block size and then kept up to date by markVisited
+        cache = floorData.setdefault("visitedBlocks", {})
+        if blockSize not in cache:
+            cache[blockSize] = set((r // blockSize, c // blockSize) for r, c in floorData["visited"])
+        return cache[blockSize]
+
     def getCurrentRoom(self):
         pp = self.playerPosition
-        return self.floors[pp[0]]["rooms"][(pp[1],pp[2])]
+        return self.refreshRoom(self.ownFloor(pp[0])["rooms"][(pp[1],pp[2])])
 
     def getRoom(self, floor, row, col):
-        return self.floors[floor]["rooms"][(row, col)]
+        return self.refreshRoom(self.ownFloor(floor)["rooms"][(row, col)])
+
+    def refreshRoom(self, room):
+        # rooms from before the last resetRooms are emptied the first time they are looked at
+        if room.epoch != self.epoch:
+            room.epoch = self.epoch
+            room.hasContents = False
+            room.monster = None
+        return room
 
     def movePlayer(self, direction):
         newPos = list(self.playerPosition)
@@ -137,6 +258,7 @@ class Map:
         
         room = self.getRoom(floor, row, col)
         room.seen = True
+        self.markVisited(self.ownFloor(floor), row, col)
         if room.monster:
             room.monster.seen = True
             room.monster.known = True
@@ -161,13 +283,7 @@ class Map:
                     self.fillRoom(self.getRoom(floor, row, col - 1))
 
     def resetRooms(self):
-        for f in range(self.numFloors):
-            floor = self.floors[f]
-            for r in range(self.width):
-                for c in range(self.width):
-                    room = floor["rooms"][(r,c)]
-                    room.hasContents = False
-                    room.monster = None
+        self.epoch += 1
         pp = self.playerPosition
         lastRoom = self.getRoom(pp[0], pp[1], pp[2])
         lastRoom.hasContents = True
@@ -179,59 +295,84 @@ class Map:
         else:
             room.generateContents(self.dungeonLevel)
 
-    def printFloor(self, turn, nextLevel):
+    def getViewport(self, columns, lines):
+        # each room takes 5 columns and 2 lines, the legend keeps 30 columns and the prompt 5 lines
+        labelWidth = len(str(self.width - 1)) + 1
+        viewWidth = max(1, min(self.width, (columns - labelWidth - 30 + 2) // 5))
+        viewHeight = max(1, min(self.width, (lines - 5 + 1) // 2))
+        top = min(max(self.playerPosition[1] - viewHeight // 2, 0), self.width - viewHeight)
+        left = min(max(self.playerPosition[2] - viewWidth // 2, 0), self.width - viewWidth)
+        return top, left, viewHeight, viewWidth
+
+    def printFloor(self, turn, nextLevel, size = None):
         floor = self.playerPosition[0]
+        floorData = self.getFloor(floor)
         mapBuffer = []
         legendBuffer = [
             f"{fore.CYAN}{style.BOLD}Legend:{style.RESET}", 
             f"{fore.GREEN}< >{style.RESET} / {fore.RED}{'{'} {'}'}{style.RESET} : Stairs Up/Down"
         ]
 
+        if size is None:
+            size = shutil.get_terminal_size()
+        top, left, viewHeight, viewWidth = self.getViewport(size[0], size[1])
+        labelWidth = len(str(self.width - 1)) + 1
+
         ppSlug = f"[{self.playerPosition[1]},{self.playerPosition[2]}]"
         print(f"{fore.MAGENTA}{style.BOLD}Dungeon Level {floor + 1} - Turn {turn}{style.RESET}{style.DIM}/{nextLevel}{style.RESET}")
 
         # print top map header
-        header = f"{style.DIM}  "
-        for c in range(self.width):
-            header +=(f" {c} ")
-            if (c < self.width - 1):
+        header = f"{style.DIM}{' ' * labelWidth}"
+        for c in range(left, left + viewWidth):
+            header += f"{c:^3}"
+            if (c < left + viewWidth - 1):
                 header += "  "
         mapBuffer.append(header)
 
         # print map rows
         monsterList = []
-        for r in range(self.width):
+        for r in range(top, top + viewHeight):
             roomRow = ""
-            roomRow += f"{style.DIM}{r} {style.RESET}"
-            for c in range(self.width):
-                room = self.floors[floor]["rooms"][(r,c)]
+            roomRow += f"{style.DIM}{str(r).ljust(labelWidth)}{style.RESET}"
+            for c in range(left, left + viewWidth):
+                room = self.refreshRoom(floorData["rooms"][(r,c)])
                 isCurrentRoom = self.playerPosition[1] == r and self.playerPosition[2] == c
                 stairType = ""
                 try:
-                    stairs = self.floors[floor]["stairs"][(r,c)]
+                    stairs = floorData["stairs"][(r,c)]
                     stairType = stairs.stairDir
                 except KeyError:
                     pass
                 roomRow += room.printMap(isCurrentRoom, monsterList, stairType)
-                if c < self.width - 1:
-                    door = self.floors[floor]["doors"]["ew"][(r,c)]
+                if c < left + viewWidth - 1:
+                    door = floorData["doors"]["ew"][(r,c)]
                     roomRow += door.printMap()
             mapBuffer.append(roomRow)
 
-            if r < self.width - 1:
-                doorRow = "  "
-                for c in range(self.width):
-                    door = self.floors[floor]["doors"]["ns"][(r,c)]
+            if r < top + viewHeight - 1:
+                doorRow = " " * labelWidth
+                for c in range(left, left + viewWidth):
+                    door = floorData["doors"]["ns"][(r,c)]
                     doorRow += door.printMap()
-                    if c < self.width - 1:
+                    if c < left + viewWidth - 1:
                         doorRow += "  "
                 mapBuffer.append(doorRow)
         
+        monsterLines = []
         for i, monster in enumerate(monsterList):
             monsterLine = f"{back.DARK_RED_1}{fore.ORANGE_3}{i + 1}{style.RESET} {monster.name}"
             if monster.seen:
                 monsterLine += f" {style.DIM}({monster.hp}/{monster.maxHp})"
-            legendBuffer.append(monsterLine)
+            monsterLines.append(monsterLine)
+
+        if viewHeight < self.width or viewWidth < self.width:
+            # keep the legend as tall as the map so the screen size bounds the whole frame
+            legendBuffer += self.getMinimap(floorData, top, left, viewHeight, viewWidth, max(1, min(20, len(mapBuffer) - 4)))
+            room = max(len(mapBuffer) - len(legendBuffer), 0)
+            if len(monsterLines) > room:
+                hidden = len(monsterLines) - room + 1
+                monsterLines = monsterLines[:room - 1] + [f"{style.DIM}...and {hidden} more{style.RESET}"] if room > 0 else []
+        legendBuffer += monsterLines
 
         mapLineWidth = len(mapBuffer[0])
         for b in range(max(len(mapBuffer), len(legendBuffer))):
@@ -247,8 +388,35 @@ class Map:
                 pass
             print(f"{mapLine} {style.DIM}| {style.RESET}{legendLine}")
 
+    def getMinimap(self, floorData, top, left, viewHeight, viewWidth, maxSize = 20):
+        # one cell per block of rooms, built from the visited blocks instead of scanning the floor
+        blockSize = -(-self.width // maxSize)
+        cells = -(-self.width // blockSize)
+        visited = Map.getVisitedBlocks(floorData, blockSize)
+        stairs = {}
+        for (r, c), stair in floorData["stairs"].items():
+            if floorData["rooms"][(r, c)].known:
+                stairs[(r // blockSize, c // blockSize)] = stair.stairDir
+        player = (self.playerPosition[1] // blockSize, self.playerPosition[2] // blockSize)
+
+        lines = [f"{fore.CYAN}{style.BOLD}Overview:{style.RESET}"]
+        for br in range(cells):
+            line = ""
+            for bc in range(cells):
+                inView = top // blockSize <= br <= (top + viewHeight - 1) // blockSize and left // blockSize <= bc <= (left + viewWidth - 1) // blockSize
+                if (br, bc) == player:
+                    line += f"{fore.WHITE}{back.BLUE}{style.BOLD}*{style.RESET}"
+                elif (br, bc) in stairs:
+                    line += f"{fore.RED if stairs[(br, bc)] == 'down' else fore.GREEN}{style.BOLD}{'{' if stairs[(br, bc)] == 'down' else '<'}{style.RESET}"
+                elif (br, bc) in visited:
+                    line += "#" if inView else f"{style.DIM}#{style.RESET}"
+                else:
+                    line += f"{style.DIM}.{style.RESET}" if inView else " "
+            lines.append(line)
+        return lines
+
     def getCurrentDoors(self):
-        floor = self.floors[self.playerPosition[0]]
+        floor = self.getFloor(self.playerPosition[0])
         r = self.playerPosition[1]
         c = self.playerPosition[2]
         return self.getRoomDoors(floor, r, c)
@@ -286,7 +454,7 @@ class Map:
 
     def discoverStairs(self):
         pp = self.playerPosition
-        floor = self.floors[pp[0]]
+        floor = self.getFloor(pp[0])
         for key, stair in floor["stairs"].items():
             if stair.stairDir == "down":
                 room = self.getRoom(pp[0], key[0], key[1])
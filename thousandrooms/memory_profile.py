@@ -0,0 +1,213 @@
+import sys
+import json
+import time
+import types
+import threading
+import tracemalloc
+from collections import deque
+
+from colored import style
+
+from .utils import Utils
+from .item_list import ItemList
+from .monster_list import MonsterList
+from .room_list import RoomList
+from .monster_template import MonsterTemplate
+from .prefetch import Prefetcher
+
+class MemoryReport:
+    skipTypes = (type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType, staticmethod, classmethod, property, type(threading.Lock()))
+    sharedIds = None
+    sharedObjects = None
+
+    @staticmethod
+    def getSharedIds():
+        # game data tables are loaded once per process and shared by every session, so they aren't charged to one
+        if MemoryReport.sharedIds is None:
+            # the objects are kept as well, an id is only unique while its object is alive
+            shared = set()
+            kept = []
+            MemoryReport.sizeOf(MonsterTemplate.getAll(), shared, kept)
+            for table in [ItemList, MonsterList, RoomList]:
+                for key, value in vars(table).items():
+                    if not key.startswith("__"):
+                        MemoryReport.sizeOf(value, shared, kept)
+            MemoryReport.sharedIds = shared
+            MemoryReport.sharedObjects = kept
+        return MemoryReport.sharedIds
+
+    @staticmethod
+    def sizeOf(obj, seen, kept = None):
+        # deep size of everything reachable from obj that isn't already in seen
+        size = 0
+        stack = [obj]
+        while len(stack) > 0:
+            o = stack.pop()
+            if id(o) in seen or isinstance(o, MemoryReport.skipTypes):
+                continue
+            seen.add(id(o))
+            if kept is not None:
+                kept.append(o)
+            size += sys.getsizeof(o)
+            if isinstance(o, dict):
+                stack.extend(o.keys())
+                stack.extend(o.values())
+            elif isinstance(o, (list, tuple, set, frozenset, deque)):
+                stack.extend(o)
+            if hasattr(o, "__dict__"):
+                stack.append(o.__dict__)
+        return size
+
+    @staticmethod
+    def measure(game):
+        # each subsystem is charged for what it reaches first, in this order, so nothing is counted twice
+        seen = set(MemoryReport.getSharedIds())
+        gameMap = game.map
+        player = game.player
+        floors = gameMap.floors if gameMap else []
+
+        rooms = [room for floor in floors for room in dict.values(floor["rooms"])]
+        doors = [door for floor in floors for kind in ["ns", "ew"] for door in dict.values(floor["doors"][kind])]
+        monsters = [room.monster for room in rooms if room.monster]
+        if game.monster and game.monster not in monsters:
+            monsters.append(game.monster)
+
+        sections = [
+            ("monsters", monsters, len(monsters)),
+            ("rooms", rooms, len(rooms)),
+            ("doors", doors, len(doors)),
+            ("floors", floors, len(floors)),
+            ("items", player.items if player else None, len(player.items) if player else 0),
+            ("monsterLore", player.monsterLore if player else None, len(player.monsterLore) if player else 0),
+            ("history", player.history if player else None, len(player.history) if player else 0),
+            ("resolution", game.resolution, len(game.resolution)),
+            ("store", game.store, len(game.store.items) if game.store else 0),
+            ("player", player, 1 if player else 0),
+            ("map", gameMap, 1 if gameMap else 0),
+            ("game", game, 1)
+        ]
+        report = {}
+        for name, obj, count in sections:
+            report[name] = { "bytes": MemoryReport.sizeOf(obj, seen) if obj is not None else 0, "count": count }
+        report["total"] = { "bytes": sum(section["bytes"] for section in report.values()), "count": None }
+        return report
+
+    @staticmethod
+    def compare(before, after):
+        return { name: after[name]["bytes"] - before.get(name, { "bytes": 0 })["bytes"] for name in after }
+
+    @staticmethod
+    def printReport(report, before = None):
+        changes = MemoryReport.compare(before, report) if before else None
+        rows = []
+        for name, section in report.items():
+            row = {
+                "name": name,
+                "count": "" if section["count"] is None else f"{section['count']}",
+                "size": f"{section['bytes'] / 1024:.1f} KiB"
+            }
+            if changes:
+                row["change"] = f"{changes[name] / 1024:+.1f} KiB"
+            rows.append(row)
+        header = ["Subsystem", "Count", "Size"] + (["Change"] if changes else [])
+        Utils.printTable(header, rows, [14, 10, 14, 14])
+
+class MemoryProfiler:
+    # wraps the game's resolvers so every call records how much memory it allocated and kept
+    sampleInterval = 100
+    recentSize = 1000
+
+    def __init__(self, game):
+        self.game = game
+        self.resolvers = {}
+        self.stats = {}
+        self.recent = deque(maxlen=MemoryProfiler.recentSize)
+        self.samples = []
+        self.lastSample = None
+        self.startedTracing = False
+        self.prefetchEnabled = Prefetcher.enabled
+
+    def start(self):
+        # a prefetch running beside a resolver would have its allocations charged to that resolver
+        self.prefetchEnabled = Prefetcher.enabled
+        Prefetcher.enabled = False
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.startedTracing = True
+        self.resolvers = dict(self.game.resolver)
+        for mode, resolver in self.resolvers.items():
+            self.game.resolver[mode] = self.wrap(resolver)
+        self.sample()
+
+    def wrap(self, resolver):
+        name = resolver.__name__
+        def traced(action):
+            turn = self.game.turn
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            try:
+                return resolver(action)
+            finally:
+                current, peak = tracemalloc.get_traced_memory()
+                self.record(name, turn, action, current - before, peak - before)
+        return traced
+
+    def record(self, name, turn, action, retained, peak):
+        stats = self.stats.setdefault(name, { "calls": 0, "retained": 0, "maxRetained": 0, "maxPeak": 0 })
+        stats["calls"] += 1
+        stats["retained"] += retained
+        stats["maxRetained"] = max(stats["maxRetained"], retained)
+        stats["maxPeak"] = max(stats["maxPeak"], peak)
+        self.recent.append({ "turn": turn, "resolver": name, "action": action, "retained": retained, "peak": peak })
+        if self.game.turn - self.lastSample >= MemoryProfiler.sampleInterval:
+            self.sample()
+
+    def sample(self):
+        # the subsystem breakdown over time is what shows history or lore that never stops growing
+        self.lastSample = self.game.turn
+        report = MemoryReport.measure(self.game)
+        self.samples.append({ "turn": self.game.turn, "time": time.time(), "sections": { name: section["bytes"] for name, section in report.items() } })
+
+    def getGrowth(self):
+        # sections that got bigger at every sample
+        if len(self.samples) < 3:
+            return []
+        growing = []
+        for name in self.samples[-1]["sections"]:
+            sizes = [sample["sections"][name] for sample in self.samples]
+            if all(b > a for a, b in zip(sizes, sizes[1:])):
+                growing.append(name)
+        return growing
+
+    def stop(self):
+        for mode, resolver in self.resolvers.items():
+            self.game.resolver[mode] = resolver
+        self.resolvers = {}
+        Prefetcher.enabled = self.prefetchEnabled
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+
+    def printReport(self):
+        rows = []
+        for name, stats in sorted(self.stats.items(), key=lambda entry: -entry[1]["retained"]):
+            rows.append({
+                "name": name,
+                "calls": f"{stats['calls']}",
+                "retained": f"{stats['retained'] / 1024:+.1f} KiB",
+                "perCall": f"{stats['retained'] / stats['calls']:+.0f} B",
+                "maxPeak": f"{stats['maxPeak'] / 1024:.1f} KiB"
+            })
+        Utils.printTable(["Resolver", "Calls", "Retained", "Per Call", "Max Peak"], rows, [18, 8, 14, 12, 12])
+        growing = self.getGrowth()
+        if len(growing) > 0:
+            print(f"\n{style.BOLD}Growing every sample:{style.RESET} {', '.join(growing)}")
+
+    def save(self, path):
+        with open(path, "w") as reportFile:
+            json.dump({
+                "resolvers": self.stats,
+                "recent": list(self.recent),
+                "samples": self.samples,
+                "growing": self.getGrowth()
+            }, reportFile)
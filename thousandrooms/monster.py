@@ -1,57 +1,65 @@
 import random
+from collections import Counter
 
 from colored import fore, back, style
 
-from .monster_list import MonsterList
+from .monster_template import MonsterTemplate
+from .data_registry import DataRegistry
 from .creature import Creature
 from .utils import Utils
+from .sampling import AliasTable, BulkRandom
 
 class Monster(Creature):
     distribution = [0,0,0,0,0,0,0,1,1,1,1,1,2,2,2,1,3,3,3,4,4,5,5,6,6,7,7]
+    stateFields = ["id", "templateIndex", "templateName", "level", "hd", "atk", "ac", "hp", "maxHp", "charges", "chargeRate", "isBoss", "seen", "known", "levelDiff", "bossDescriptor"]
 
-    def __init__(self, dungeonLevel, data = None):
-        genlevel = random.randint(max(1, dungeonLevel - 1), dungeonLevel + 1)
+    def __init__(self, dungeonLevel, data = None, spawn = None):
+        # spawn is a pre-rolled (genlevel, template, hp) from generateMany
+        genlevel = spawn[0] if spawn else random.randint(max(1, dungeonLevel - 1), dungeonLevel + 1)
         self.charges = 0
         self.chargeRate = 1
         self.isBoss = False
-        self.quotes = None
         self.seen = False
         self.known = False
+        self.levelDiff = 0
+        self.bossDescriptor = -1
         isBoss = data and data["id"] < 0
         if data and not isBoss:
             for k in data:
-                setattr(self, k, data[k])
-            try:
-                test = self.displayName
-            except AttributeError:
-                self.displayName = self.name
+                if k in Monster.stateFields:
+                    setattr(self, k, data[k])
+            # loaded monsters take the current tables, matched on name as well since ids repeat
+            # (saves from older versions store the full monster record, including its name)
+            name = data.get("templateName", data.get("name"))
+            templates = MonsterTemplate.getAll()
+            index = data.get("templateIndex", -1)
+            template = templates[index] if 0 <= index < len(templates) else None
+            if template is None or template.id != self.id or (name and template.name != name):
+                template = MonsterTemplate.find(self.id, name) or MonsterTemplate.getDefault(self.level)
+            self.setTemplate(template)
+            if "templateIndex" not in data and "displayName" in data:
+                self.decodeName(data["displayName"])
         else:
             monsterLevel = data["floor"] + 1 if isBoss else genlevel
-            info = self.getMonster(monsterLevel)
-            Creature.__init__(self, info)
+            template = spawn[1] if spawn else self.getMonster(monsterLevel)
+            Creature.__init__(self, {
+                "id": template.id,
+                "level": template.level,
+                "hd": template.hd,
+                "atk": template.atk,
+                "ac": template.ac
+            })
+            self.setTemplate(template)
             self.level = monsterLevel
             self.ac += 10
-            self.displayName = self.name
 
             if isBoss:
                 # generate boss monster
                 self.isBoss = True
 
-                descriptor = random.choice(MonsterList.bossDescriptors[self.type])
-                try:
-                    descriptor = random.choice(MonsterList.bossDescriptors[self.subtype])
-                except KeyError:
-                    pass
-                if descriptor[0]:
-                    self.displayName = f"{descriptor[0]} {self.displayName}"
-                if descriptor[1]:
-                    self.displayName += f" {descriptor[1]}"
-
-                self.quotes = MonsterList.bossQuotes[self.type]
-                try:
-                    self.quotes = MonsterList.bossQuotes[self.subtype]
-                except KeyError:
-                    pass
+                pool = template.bossDescriptors
+                if len(pool) > 0:
+                    self.bossDescriptor = random.randrange(len(pool))
 
                 diffFactor = max(dungeonLevel, data["floor"]) + 2
                 self.chargeRate = 2
@@ -64,23 +72,106 @@ class Monster(Creature):
                 # improved monsters
                 levelDiff = dungeonLevel - self.level
                 if levelDiff > 0:
-                    descriptor = MonsterList.descriptors[self.type][levelDiff // 2]
-                    try:
-                        descriptor = MonsterList.descriptors[self.subtype][levelDiff // 2]
-                    except KeyError:
-                        pass
-                    self.displayName = f"{descriptor} {self.displayName}"
+                    self.levelDiff = levelDiff
                     self.level += levelDiff
                     self.atk += 2 * levelDiff
                     self.ac += 2 * levelDiff    
                     self.hd += levelDiff    
 
                 self.maxHp = self.hd * self.level
-                self.hp = 0
-                for x in range(self.level):
-                    self.hp += random.randint(self.hd // 2, self.hd)
-                                    
-    def printStats(self, playerLore):
+                if spawn:
+                    self.hp = spawn[2]
+                else:
+                    self.hp = 0
+                    for x in range(self.level):
+                        self.hp += random.randint(self.hd // 2, self.hd)
+
+    @staticmethod
+    def generateMany(dungeonLevel, n):
+        genlevels = BulkRandom.randints(max(1, dungeonLevel - 1), dungeonLevel + 1, n)
+        version = DataRegistry.current
+        templates = []
+        for genlevel, count in sorted(Counter(genlevels).items()):
+            templates += [(genlevel, template) for template in Monster.getSampler(genlevel, version).sampleMany(count)]
+        random.shuffle(templates)
+
+        # hit dice and level after the same improvement the constructor applies
+        levels = [max(genlevel, dungeonLevel) for genlevel, template in templates]
+        hitDice = [template.hd + max(dungeonLevel - genlevel, 0) for genlevel, template in templates]
+        hps = BulkRandom.sumRolls([hd // 2 for hd in hitDice], hitDice, levels)
+        return [Monster(dungeonLevel, None, (genlevel, template, hp)) for (genlevel, template), hp in zip(templates, hps)]
+
+    def setTemplate(self, template):
+        self.templateIndex = template.index
+        self.templateName = template.name
+        self.dataVersion = template.version
+        DataRegistry.get(self.dataVersion).liveMonsters.add(self)
+
+    def __setstate__(self, state):
+        # copies made for forks and saves keep their version alive as well
+        self.__dict__.update(state)
+        DataRegistry.get(self.dataVersion).liveMonsters.add(self)
+
+    @property
+    def template(self):
+        return MonsterTemplate.get(self.templateIndex, DataRegistry.get(self.dataVersion))
+
+    @property
+    def name(self):
+        return self.template.name
+
+    @property
+    def type(self):
+        return self.template.type
+
+    @property
+    def subtype(self):
+        return self.template.subtype
+
+    @property
+    def atk_type(self):
+        return self.template.atk_type
+
+    @property
+    def resist(self):
+        return self.template.resist
+
+    @property
+    def vulnerability(self):
+        return self.template.vulnerability
+
+    @property
+    def special(self):
+        return self.template.special
+
+    @property
+    def quotes(self):
+        return self.template.bossQuotes if self.isBoss else None
+
+    @property
+    def displayName(self):
+        displayName = self.name
+        if self.bossDescriptor >= 0:
+            descriptor = self.template.bossDescriptors[self.bossDescriptor]
+            if descriptor[0]:
+                displayName = f"{descriptor[0]} {displayName}"
+            if descriptor[1]:
+                displayName += f" {descriptor[1]}"
+        elif self.levelDiff > 0:
+            displayName = f"{self.template.descriptors[self.levelDiff // 2]} {displayName}"
+        return displayName
+
+    def decodeName(self, displayName):
+        if self.isBoss:
+            for i, descriptor in enumerate(self.template.bossDescriptors):
+                if displayName.startswith(descriptor[0]) and displayName.endswith(descriptor[1]):
+                    self.bossDescriptor = i
+        elif displayName != self.name:
+            descriptor = displayName.split(" ")[0]
+            if descriptor in self.template.descriptors:
+                self.levelDiff = self.template.descriptors.index(descriptor) * 2 + 1
+
+    def printStats(self, playerLore, odds = None):
         nameColor = fore.DARK_ORANGE_3B if self.isBoss else fore.RED
         print(f"{nameColor}{style.BOLD}{self.displayName} ({str(self.level)}){style.RESET}")
         try:
@@ -105,26 +196,47 @@ class Monster(Creature):
                 "Special Attack": special if lore["special"] else unknown
             }
         ]
+        if odds:
+            stats.append({
+                "Win Chance": f"{round(odds['win'] * 100)}%",
+                "Death Chance": f"{round(odds['lose'] * 100)}%"
+            })
         Utils.printStats(stats)
 
     def getAtkVerb(self):
-        verbs = MonsterList.atkVerbs[self.atk_type]
-        try:
-            verbs = MonsterList.atkVerbs[self.type][self.atk_type]
-        except KeyError:
-            pass
+        return random.choice(self.template.atkVerbs)
+
+    @staticmethod
+    def getMonster(level):
+        return Monster.getSampler(level).sample()
+
+    @staticmethod
+    def getSampler(level, version = None):
+        version = version or DataRegistry.current
         try:
-            verbs = MonsterList.atkVerbs[self.subtype][self.atk_type]
+            return version.monsterSamplers[level]
         except KeyError:
             pass
-        return random.choice(verbs)
+
+        # level - d(distribution), rerolled while not positive, then a uniform pick at that level
+        monsters = []
+        weights = []
+        for offset in set(Monster.distribution):
+            randomLevel = level - offset
+            if randomLevel > 0:
+                candidates = [monster for monster in MonsterTemplate.getAll(version) if monster.level == randomLevel]
+                for monster in candidates:
+                    monsters.append(monster)
+                    weights.append(Monster.distribution.count(offset) / len(candidates))
+        sampler = AliasTable(monsters, weights)
+        version.monsterSamplers[level] = sampler
+        return sampler
 
     @staticmethod
-    def getMonster(level):
-        randomLevel = 0
-        while randomLevel <= 0:
-            randomLevel = level - random.choice(Monster.distribution)
-        monsters = [monster for monster in MonsterList.monsters if monster["level"] == randomLevel] 
-        info = random.choice(monsters)
-        return info
+    def warmSamplers(version, previous):
+        MonsterTemplate.getAll(version)
+        for level in list(previous.monsterSamplers):
+            Monster.getSampler(level, version)
+
+DataRegistry.addWarmer(Monster.warmSamplers)
 
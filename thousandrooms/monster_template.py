@@ -0,0 +1,50 @@
+from .monster_list import MonsterList
+from .data_registry import DataRegistry
+
+class MonsterTemplate:
+    def __init__(self, index, info, version = 0):
+        self.index = index
+        self.version = version
+        for k in info:
+            if k:
+                setattr(self, k, info[k])
+
+        # resolve subtype overrides once so spawning and attacking are plain reads
+        self.descriptors = MonsterTemplate.resolve(MonsterList.descriptors, self.type, self.subtype, [])
+        self.bossDescriptors = MonsterTemplate.resolve(MonsterList.bossDescriptors, self.type, self.subtype, [])
+        self.bossQuotes = MonsterTemplate.resolve(MonsterList.bossQuotes, self.type, self.subtype, None)
+
+        verbs = MonsterList.atkVerbs
+        self.atkVerbs = verbs.get(self.atk_type)
+        self.atkVerbs = verbs.get(self.type, {}).get(self.atk_type, self.atkVerbs)
+        self.atkVerbs = verbs.get(self.subtype, {}).get(self.atk_type, self.atkVerbs)
+
+    @staticmethod
+    def resolve(table, type, subtype, default):
+        return table.get(subtype, table.get(type, default))
+
+    @staticmethod
+    def get(index, version = None):
+        return MonsterTemplate.getAll(version)[index]
+
+    @staticmethod
+    def getAll(version = None):
+        version = version or DataRegistry.current
+        if version.templates is None:
+            version.templates = [MonsterTemplate(i, info, version.number) for i, info in enumerate(version.monsters)]
+        return version.templates
+
+    @staticmethod
+    def getDefault(level, version = None):
+        # the strongest template at or below level, for monsters whose own template is gone from the tables
+        templates = MonsterTemplate.getAll(version)
+        candidates = [template for template in templates if template.level <= level] or templates
+        return max(candidates, key=lambda template: template.level)
+
+    @staticmethod
+    def find(id, name = None, version = None):
+        # ids are not unique in MonsterList, so match on name as well when there is one
+        for template in MonsterTemplate.getAll(version):
+            if template.id == id and (name is None or template.name == name):
+                return template
+        return None
@@ -5,6 +5,7 @@ from colored import fore, back, style
 
 from .creature import Creature
 from .item import Item
+from .inventory import Inventory
 from .utils import Utils
 from .item_list import ItemList
 
@@ -19,7 +20,8 @@ class Player(Creature):
         self.history = {}
         self.name = name
         self.nextLevel = 100
-        self.items = []
+        self.items = Inventory()
+        self.slots = { "weapon": None, "armor": None, "ring": None }
         self.skills = []
         self.innateAbilities = {}
         self.abilities = {}
@@ -46,15 +48,20 @@ class Player(Creature):
                 "sell_item": 0,
                 "dmg_done": 0,
                 "dmg_taken": 0,
-                "epitaph": "Still exploring..."
+                "epitaph": "Still exploring...",
+                "floor_turns": [1],
+                "level_turns": [1]
             }
         }
         Creature.__init__(self, info)
 
     def loadItems(self, itemData):
-        self.items = []
+        self.items = Inventory()
+        self.slots = { "weapon": None, "armor": None, "ring": None }
         for data in itemData:
-            self.items.append(Item(0, data))
+            item = self.items.add(Item(0, data))
+            if item.equipped:
+                self.slots[item.kind] = item
 
     def addGold(self, value):
         self.gp += value
@@ -66,67 +73,97 @@ class Player(Creature):
         # auto-equip item if no item of this type is equipped
         kind = item.kind
         if kind == "usable":
-            found = False
-            for invItem in self.items:
-                if invItem.id == item.id:
-                    found = True
-                    invItem.stack += 1
-            if not found:
-                self.items.append(item)
+            if not self.items.stack(item):
+                self.items.add(item)
         else:
-            found = False
-            for invItem in self.items:
-                if invItem.kind == kind:
-                    found = True
-            if not found:
+            equip = not self.items.hasKind(kind)
+            item = self.items.add(item)
+            if equip:
+                item = self.items.own(item)
                 item.equipped = True
-            self.items.append(item)
+                self.slots[kind] = item
             self.applyItems()
         
     def removeItem(self, item):
+        # returns the item that leaves, a usable taken off a stack leaves as a single new item
         if item.kind == "usable" and item.stack > 1:
-            item.stack -= 1
+            self.items.own(item).stack -= 1
+            item = copy.copy(item)
+            item.uid = 0
+            item.stack = 1
         else:
             self.items.remove(item)
-        self.applyItems()
+            if self.isEquipped(item):
+                self.slots[item.kind] = None
+                self.applyItems()
+        return item
         
     def equipItem(self, newItem):
-        for invItem in self.items:
-            if invItem.kind == newItem.kind and invItem.equipped:
-                invItem.equipped = False
+        if newItem.kind not in self.slots:
+            return
+        oldItem = self.slots[newItem.kind]
+        if oldItem:
+            self.ownItem(oldItem).equipped = False
+        newItem = self.ownItem(newItem)
         newItem.equipped = True
+        self.slots[newItem.kind] = newItem
 
         self.applyItems()
         
     def unequipItem(self, kind):
-        for invItem in self.items:
-            if invItem.kind == kind and invItem.equipped:
-                invItem.equipped = False
+        oldItem = self.slots[kind]
+        if oldItem:
+            self.ownItem(oldItem).equipped = False
+            self.slots[kind] = None
         self.applyItems()
+
+    def isEquipped(self, item):
+        slotItem = self.slots.get(item.kind)
+        return slotItem is not None and slotItem.uid == item.uid
+
+    def ownItem(self, item):
+        # items may be shared with a forked game, so take a private copy before changing one
+        ownItem = self.items.own(item)
+        if self.isEquipped(ownItem):
+            self.slots[ownItem.kind] = ownItem
+        return ownItem
+
+    def fork(self):
+        forked = copy.copy(self)
+        forked.history = dict(self.history)
+        forked.monsterLore = { id: dict(lore) for id, lore in self.monsterLore.items() }
+        forked.innateAbilities = dict(self.innateAbilities)
+        forked.abilities = dict(self.abilities)
+        forked.conditions = dict(self.conditions)
+        forked.resist = list(self.resist)
+        forked.skills = list(self.skills)
+        forked.items = self.items.fork()
+        forked.slots = dict(self.slots)
+        return forked
         
     def applyItems(self):
+        # only the equipped slots contribute, so this does not depend on inventory size
         self.atk = (self.level + 1) // 2
         self.ac = 10
         self.abilities = copy.copy(self.innateAbilities)
         self.resist = []
         self.atkType = "blunt"
 
-        for item in self.items:
-            if item.equipped:
+        for kind, item in self.slots.items():
+            if item:
                 if item.atk:
                     self.atk += item.atk
                 if item.ac:
                     self.ac += item.ac
-                if item.kind == "weapon":
+                if kind == "weapon":
                     self.atkType = item.type
-                if item.ability:
-                    if "resist_" in item.ability:
-                        self.resist.append(item.ability.replace("resist_", ""))
-                    else:
-                        try: 
-                            self.abilities[item.ability] += item.getAbilityLevel()
-                        except KeyError:
-                            self.abilities[item.ability] = item.getAbilityLevel()
+                if item.resistType:
+                    self.resist.append(item.resistType)
+                elif item.ability:
+                    try: 
+                        self.abilities[item.ability] += item.getAbilityLevel()
+                    except KeyError:
+                        self.abilities[item.ability] = item.getAbilityLevel()
 
         super().calculateDam()
 
@@ -163,8 +200,20 @@ class Player(Creature):
             self.xp = 0
             
     def killedBy(self, monster, level):
+        self.history["killed_by"] = monster.name
+        self.history["killed_by_level"] = monster.level
+        self.history["death_floor"] = level
         self.setEpitaph(f"Killed by a {monster.name} on level {level}.")
 
+    def trackProgress(self, floor, turn):
+        # the turn each floor and each player level was first reached, lists are replaced rather than appended so forks don't share them
+        floorTurns = self.history.get("floor_turns", [])
+        if len(floorTurns) <= floor:
+            self.history["floor_turns"] = floorTurns + [turn] * (floor + 1 - len(floorTurns))
+        levelTurns = self.history.get("level_turns", [])
+        if len(levelTurns) < self.level:
+            self.history["level_turns"] = levelTurns + [turn] * (self.level - len(levelTurns))
+
     def setEpitaph(self, text):
         self.history["epitaph"] = text
 
@@ -0,0 +1,89 @@
+import copy
+import random
+import threading
+
+from .store import Store
+
+class Prefetcher:
+    enabled = True
+
+    def __init__(self):
+        self.thread = None
+        self.store = None
+        self.floor = None
+
+    def start(self, game):
+        # speculate while the game waits for input, starting from the random state the next action will see
+        self.settle()
+        self.store = None
+        self.floor = None
+        if not Prefetcher.enabled or game.player is None or game.map is None:
+            return
+        self.thread = threading.Thread(target=self.run, args=(game, random.getstate()), daemon=True)
+        self.thread.start()
+
+    def settle(self):
+        # the worker borrows the global random state, so it must finish before the game rolls again
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def run(self, game, state):
+        try:
+            if Prefetcher.wantsStore(game):
+                store = Store(game.level)
+                self.store = (game.level, state, store, random.getstate())
+                random.setstate(state)
+            if Prefetcher.wantsFloor(game):
+                gameMap = game.map
+                f = gameMap.playerPosition[0] + 1
+                shadow = copy.copy(gameMap)
+                shadow.floors = list(gameMap.floors)
+                shadow.floors[f] = copy.deepcopy(gameMap.floors[f])
+                shadow.ownedFloors = set([f])
+                shadow.playerPosition = list(gameMap.playerPosition)
+                shadow.movePlayer("d")
+                self.floor = (gameMap.floors[f], gameMap.epoch, gameMap.dungeonLevel, list(gameMap.playerPosition), state, shadow, random.getstate())
+        except Exception:
+            self.store = None
+            self.floor = None
+        finally:
+            random.setstate(state)
+
+    @staticmethod
+    def wantsStore(game):
+        if game.mode == "peace":
+            return not game.player.hasIdol
+        if game.mode == "inventory":
+            return any(item.effect == "shopping" for item in game.player.items.getView("usable"))
+        return False
+
+    @staticmethod
+    def wantsFloor(game):
+        if game.mode != "map" or game.map.playerPosition[0] >= game.map.numFloors - 1:
+            return False
+        return any(key == "down" and door.isValid() for key, door in game.map.getCurrentDoors())
+
+    def takeStore(self, level):
+        self.settle()
+        prefetched = self.store
+        self.store = None
+        if prefetched and prefetched[0] == level and prefetched[1] == random.getstate():
+            random.setstate(prefetched[3])
+            return prefetched[2]
+        return Store(level)
+
+    def descend(self, gameMap):
+        self.settle()
+        prefetched = self.floor
+        self.floor = None
+        f = gameMap.playerPosition[0] + 1
+        if prefetched:
+            source, epoch, dungeonLevel, position, state, shadow, nextState = prefetched
+            if source is gameMap.floors[f] and epoch == gameMap.epoch and dungeonLevel == gameMap.dungeonLevel and position == gameMap.playerPosition and state == random.getstate():
+                gameMap.floors[f] = shadow.floors[f]
+                gameMap.ownedFloors.add(f)
+                gameMap.playerPosition = shadow.playerPosition
+                random.setstate(nextState)
+                return
+        gameMap.movePlayer("d")
@@ -0,0 +1,199 @@
+import os
+import json
+import zlib
+import struct
+import bisect
+
+from colored import style
+
+clear=lambda: os.system('cls' if os.name == 'nt' else 'clear')
+
+class SessionRecorder:
+    # frames are stored as a full keyframe every keyframeInterval frames with line diffs in between,
+    # each run of frames shares one zlib stream that restarts at its keyframe
+    magic = b"TRREC1\n"
+    endMagic = b"TRRECEND"
+    entryHeader = struct.Struct(">BII")
+    keyframeInterval = 50
+    keyframe = 0
+    diff = 1
+    index = 2
+
+    def __init__(self, path, keyframeInterval = None):
+        self.path = path
+        self.keyframeInterval = keyframeInterval or SessionRecorder.keyframeInterval
+        self.file = open(path, "wb")
+        self.file.write(SessionRecorder.magic)
+        self.compressor = None
+        self.previous = None
+        self.turns = []
+        self.keyframes = []
+
+    def publish(self, text, turn = None):
+        lines = text.split("\n")
+        frameNumber = len(self.turns)
+        offset = self.file.tell()
+        if frameNumber % self.keyframeInterval == 0:
+            self.compressor = zlib.compressobj()
+            kind = SessionRecorder.keyframe
+            payload = text.encode("utf-8", "replace")
+            self.keyframes.append([frameNumber, offset])
+        else:
+            kind = SessionRecorder.diff
+            payload = json.dumps(SessionRecorder.diffLines(self.previous, lines), separators=(",", ":")).encode("utf-8", "replace")
+        data = self.compressor.compress(payload) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.file.write(SessionRecorder.entryHeader.pack(kind, turn or 0, len(data)))
+        self.file.write(data)
+        self.turns.append(turn or 0)
+        self.previous = lines
+
+    @staticmethod
+    def diffLines(previous, lines):
+        # runs of unchanged lines become [start, end] into the previous frame, changed lines are kept as text
+        ops = []
+        positions = {}
+        for i, line in enumerate(previous):
+            positions.setdefault(line, i)
+        for line in lines:
+            start = positions.get(line)
+            if start is None:
+                ops.append(line)
+            elif len(ops) > 0 and type(ops[-1]) is list and ops[-1][1] < len(previous) and previous[ops[-1][1]] == line:
+                ops[-1][1] += 1
+            else:
+                ops.append([start, start + 1])
+        return ops
+
+    @staticmethod
+    def applyDiff(previous, ops):
+        lines = []
+        for op in ops:
+            if type(op) is list:
+                lines.extend(previous[op[0]:op[1]])
+            else:
+                lines.append(op)
+        return lines
+
+    def close(self):
+        if not self.file:
+            return
+        # the index goes last so a recording cut short can still be read by scanning its entries
+        offset = self.file.tell()
+        index = zlib.compress(json.dumps({ "turns": self.turns, "keyframes": self.keyframes }).encode())
+        self.file.write(SessionRecorder.entryHeader.pack(SessionRecorder.index, 0, len(index)))
+        self.file.write(index)
+        self.file.write(struct.pack(">Q", offset) + SessionRecorder.endMagic)
+        self.file.close()
+        self.file = None
+
+class RecordingPlayer:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(len(SessionRecorder.magic)) != SessionRecorder.magic:
+            raise ValueError(f"{path} is not a session recording")
+        self.turns = []
+        self.keyframes = []
+        self.cached = None
+        if not self.readIndex():
+            self.scanIndex()
+        self.keyNumbers = [keyframe[0] for keyframe in self.keyframes]
+
+    def readIndex(self):
+        tailSize = 8 + len(SessionRecorder.endMagic)
+        self.file.seek(0, os.SEEK_END)
+        if self.file.tell() < len(SessionRecorder.magic) + tailSize:
+            return False
+        self.file.seek(-tailSize, os.SEEK_END)
+        tail = self.file.read(tailSize)
+        if tail[8:] != SessionRecorder.endMagic:
+            return False
+        self.file.seek(struct.unpack(">Q", tail[:8])[0])
+        kind, turn, length = SessionRecorder.entryHeader.unpack(self.file.read(SessionRecorder.entryHeader.size))
+        index = json.loads(zlib.decompress(self.file.read(length)))
+        self.turns = index["turns"]
+        self.keyframes = index["keyframes"]
+        return True
+
+    def scanIndex(self):
+        # only the entry headers are read, payloads are skipped
+        self.file.seek(len(SessionRecorder.magic))
+        while True:
+            offset = self.file.tell()
+            header = self.file.read(SessionRecorder.entryHeader.size)
+            if len(header) < SessionRecorder.entryHeader.size:
+                break
+            kind, turn, length = SessionRecorder.entryHeader.unpack(header)
+            if kind == SessionRecorder.index or len(self.file.read(length)) < length:
+                break
+            if kind == SessionRecorder.keyframe:
+                self.keyframes.append([len(self.turns), offset])
+            self.turns.append(turn)
+
+    def getFrameCount(self):
+        return len(self.turns)
+
+    def findTurn(self, turn):
+        # the first frame shown on or after turn, frame turns only ever go up
+        return min(bisect.bisect_left(self.turns, turn), len(self.turns) - 1)
+
+    def getFrame(self, frameNumber):
+        # decode forward from the nearest keyframe, or from the last frame shown when that is closer
+        k = bisect.bisect_right(self.keyNumbers, frameNumber) - 1
+        keyNumber, offset = self.keyframes[k]
+        if self.cached and keyNumber <= self.cached[0] <= frameNumber:
+            current, lines, decompressor, offset = self.cached
+        else:
+            current, lines, decompressor = keyNumber - 1, None, None
+
+        self.file.seek(offset)
+        while current < frameNumber:
+            kind, turn, length = SessionRecorder.entryHeader.unpack(self.file.read(SessionRecorder.entryHeader.size))
+            data = self.file.read(length)
+            if kind == SessionRecorder.keyframe:
+                decompressor = zlib.decompressobj()
+                lines = decompressor.decompress(data).decode("utf-8", "replace").split("\n")
+            else:
+                lines = SessionRecorder.applyDiff(lines, json.loads(decompressor.decompress(data)))
+            current += 1
+        self.cached = (current, lines, decompressor.copy(), self.file.tell())
+        return "\n".join(lines)
+
+    def close(self):
+        self.file.close()
+
+    def scrub(self):
+        count = self.getFrameCount()
+        if count == 0:
+            print("This recording has no frames")
+            return
+        frame = 0
+        while True:
+            clear()
+            print(self.getFrame(frame))
+            print(f"{style.RESET}{style.DIM}Frame {frame + 1}/{count} - Turn {self.turns[frame]}{style.RESET}")
+            print(f"{style.BOLD}\n<N>ext, <P>revious, <F>orward 10, <B>ack 10, <T>urn, <S>tart, <E>nd, <Q>uit{style.RESET}")
+            action = input()
+            if len(action) > 0:
+                action = action[0].upper()
+            if action == "N" or action == "":
+                frame += 1
+            elif action == "P":
+                frame -= 1
+            elif action == "F":
+                frame += 10
+            elif action == "B":
+                frame -= 10
+            elif action == "T":
+                print("Go to turn:")
+                try:
+                    frame = self.findTurn(int(input()))
+                except ValueError:
+                    pass
+            elif action == "S":
+                frame = 0
+            elif action == "E":
+                frame = count - 1
+            elif action == "Q":
+                return
+            frame = max(0, min(frame, count - 1))
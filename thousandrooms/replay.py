@@ -0,0 +1,81 @@
+import os
+import random
+import contextlib
+
+from .game import Game
+from .player import Player
+from .maps import Map
+from .save_stream import SaveStream
+from .save_writer import SaveWriter
+from .sampling import BulkRandom
+
+class ActionLog:
+    version = 3
+    fields = ["version", "seed", "name", "ironman", "autosave", "numFloors", "width", "generator", "inputs"]
+
+    def __init__(self, data = None):
+        self.seed = 0
+        self.name = ""
+        self.ironman = False
+        self.autosave = 0
+        self.numFloors = 10
+        self.width = 10
+        self.generator = BulkRandom.kind
+        self.inputs = []
+        if data:
+            for k in data:
+                if k in ActionLog.fields:
+                    setattr(self, k, data[k])
+
+    @staticmethod
+    def record(game, seed):
+        # call once the player and map exist, everything read after this is logged
+        log = ActionLog()
+        log.seed = seed
+        log.name = game.player.name
+        log.ironman = game.ironman
+        log.autosave = game.autosaveInterval
+        log.numFloors = game.map.numFloors
+        log.width = game.map.width
+        game.actionLog = log.inputs
+        return log
+
+    @staticmethod
+    def newSeed():
+        seed = random.randrange(2 ** 32)
+        random.seed(seed)
+        return seed
+
+    @staticmethod
+    def load(path):
+        return ActionLog(SaveStream.load(path))
+
+    def save(self, path, compression = "gzip"):
+        SaveWriter.writeFile(path, { field: getattr(self, field) for field in ActionLog.fields }, compression)
+
+class Replay:
+    @staticmethod
+    def run(log, maxInputs = None):
+        # rebuild the game from the seed and feed it the recorded inputs without rendering
+        if log.version != ActionLog.version:
+            raise ValueError(f"Action log version {log.version} can't be replayed by version {ActionLog.version}")
+        BulkRandom.checkKind(log.generator, "This action log")
+        inputs = log.inputs if maxInputs is None else log.inputs[:maxInputs]
+        random.seed(log.seed)
+        game = Game()
+        game.headless = True
+        game.analytics = None
+        game.autosaveInterval = log.autosave
+        game.scriptedInput = list(inputs)
+        game.player = Player(log.name)
+        game.map = Map(log.numFloors, log.width)
+        game.ironman = log.ironman
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            while len(game.scriptedInput) > 0 and not game.playerQuit and not game.restart:
+                game.nextTurn()
+        return game
+
+    @staticmethod
+    def runFile(path, maxInputs = None):
+        return Replay.run(ActionLog.load(path), maxInputs)
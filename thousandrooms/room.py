@@ -1,9 +1,16 @@
 import random
+import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from colored import fore, back, style
 
 from .monster import Monster
 from .room_list import RoomList
+from .sampling import BulkRandom
 
 class Room:
     def __init__(self, location, data = None, monsterData = None):
@@ -13,9 +20,14 @@ class Room:
         self.monster = None
         self.trap = None
         self.stairs = ""
+        self.epoch = 0
         if data:
             for k in data:
-                setattr(self, k, data[k])
+                if k == "name":
+                    # saves from older versions store the rendered name
+                    self.nameCode = Room.encodeName(data[k])
+                else:
+                    setattr(self, k, data[k])
             if monsterData:
                 self.monster = Monster(monsterData["level"], monsterData)
             else:
@@ -34,17 +46,63 @@ class Room:
                 self.monster = Monster(dungeonLevel - 1)
 
     def generateName(self):
-        descriptors = []
+        self.nameCode = Room.rollNameCode()
+
+    @staticmethod
+    def rollNameCode():
+        # pack one 4 bit descriptor index (+1, 0 for none) per descriptor type
+        nameCode = 0
         descriptorKeys = random.sample(RoomList.descriptor_types, random.randint(1, 2))
 
-        for key in RoomList.descriptor_types:
+        for i, key in enumerate(RoomList.descriptor_types):
             if key in descriptorKeys:
-                descriptors.append(random.choice(RoomList.descriptors[key]))
+                index = random.randrange(len(RoomList.descriptors[key]))
+                nameCode |= (index + 1) << (i * 4)
+        return nameCode
+
+    @staticmethod
+    def rollNameCodes(rows, cols):
+        # a rows x cols grid of name codes, drawn as arrays when numpy is available
+        if not numpy:
+            return [[Room.rollNameCode() for c in range(cols)] for r in range(rows)]
+        generator = BulkRandom.generator()
+        numTypes = len(RoomList.descriptor_types)
+        sizes = numpy.array([len(RoomList.descriptors[key]) for key in RoomList.descriptor_types])
+        # one or two distinct descriptor types, the second drawn from the types left over
+        first = generator.integers(0, numTypes, size=(rows, cols, 1))
+        second = (first + generator.integers(1, numTypes, size=(rows, cols, 1))) % numTypes
+        twoTypes = generator.integers(0, 2, size=(rows, cols, 1)) == 1
+        typeIndexes = numpy.arange(numTypes)
+        chosen = (typeIndexes == first) | (twoTypes & (typeIndexes == second))
+        indexes = (generator.random((rows, cols, numTypes)) * sizes).astype(numpy.int64)
+        return (((indexes + 1) << (typeIndexes * 4)) * chosen).sum(axis=2)
+
+    @property
+    def name(self):
+        return Room.renderName(self.nameCode)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def renderName(nameCode):
+        descriptors = []
+        for i, key in enumerate(RoomList.descriptor_types):
+            index = (nameCode >> (i * 4)) & 15
+            if index:
+                descriptors.append(RoomList.descriptors[key][index - 1])
+        return f"A {' '.join(descriptors)} room"
 
-        self.name = f"{fore.CYAN}A {' '.join(descriptors)} room"
+    @staticmethod
+    def encodeName(name):
+        words = name.split(" ")
+        nameCode = 0
+        for i, key in enumerate(RoomList.descriptor_types):
+            for index, descriptor in enumerate(RoomList.descriptors[key]):
+                if descriptor in words:
+                    nameCode |= (index + 1) << (i * 4)
+        return nameCode
 
     def printStats(self, exits):
-        print(self.name + style.RESET)
+        print(f"{fore.CYAN}{self.name}{style.RESET}")
         doors = []
         stairs = ""
         for exitDir, exitObj in exits:
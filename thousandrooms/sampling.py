@@ -0,0 +1,90 @@
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class GeneratorMismatch(ValueError):
+    pass
+
+class BulkRandom:
+    # numpy and the pure Python fallback draw different values from the same seed
+    kind = "numpy" if numpy else "python"
+
+    @staticmethod
+    def checkKind(kind, what):
+        if kind != BulkRandom.kind:
+            raise GeneratorMismatch(f"{what} was made {'with' if kind == 'numpy' else 'without'} numpy installed and can't be rebuilt {'without' if kind == 'numpy' else 'with'} it")
+
+    @staticmethod
+    def generator():
+        # seeded from the random module so random.seed still makes runs repeatable
+        return numpy.random.default_rng(random.getrandbits(64))
+
+    @staticmethod
+    def randints(low, high, n):
+        if numpy:
+            return BulkRandom.generator().integers(low, high + 1, size=n).tolist()
+        return [random.randint(low, high) for x in range(n)]
+
+    @staticmethod
+    def sumRolls(lows, highs, counts):
+        # one sum of counts[i] rolls of d(lows[i]..highs[i]) per entry
+        if numpy:
+            lows = numpy.repeat(numpy.asarray(lows), counts)
+            spans = numpy.repeat(numpy.asarray(highs) + 1, counts) - lows
+            rolls = lows + (BulkRandom.generator().random(len(lows)) * spans).astype(numpy.int64)
+            totals = numpy.concatenate(([0], numpy.cumsum(rolls)))
+            ends = numpy.cumsum(counts)
+            return (totals[ends] - totals[ends - numpy.asarray(counts)]).tolist()
+        out = []
+        for low, high, count in zip(lows, highs, counts):
+            total = 0
+            for x in range(count):
+                total += random.randint(low, high)
+            out.append(total)
+        return out
+
+class AliasTable:
+    def __init__(self, outcomes, weights):
+        # Vose's alias method: O(n) to build, O(1) per sample
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("AliasTable needs at least one outcome with positive weight")
+        size = len(outcomes)
+        self.outcomes = list(outcomes)
+        self.probability = [0.0] * size
+        self.alias = [0] * size
+
+        scaled = [w * size / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+        for i in large + small:
+            self.probability[i] = 1.0
+
+    def sampleMany(self, n):
+        if numpy:
+            probability = numpy.asarray(self.probability)
+            alias = numpy.asarray(self.alias)
+            generator = BulkRandom.generator()
+            columns = generator.integers(len(self.outcomes), size=n)
+            picks = numpy.where(generator.random(n) < probability[columns], columns, alias[columns])
+            return [self.outcomes[i] for i in picks.tolist()]
+        return [self.sample() for x in range(n)]
+
+    def sample(self):
+        i = random.randrange(len(self.outcomes))
+        if random.random() < self.probability[i]:
+            return self.outcomes[i]
+        return self.outcomes[self.alias[i]]
@@ -0,0 +1,80 @@
+import io
+import json
+import gzip
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class SaveStream:
+    magic = {
+        "gzip": b"\x1f\x8b",
+        "lzma": b"\xfd7zXZ\x00",
+        "zstd": b"\x28\xb5\x2f\xfd"
+    }
+
+    @staticmethod
+    def getCompressions():
+        out = ["none", "gzip", "lzma"]
+        if zstandard:
+            out.append("zstd")
+        return out
+
+    @staticmethod
+    def detect(header):
+        for compression, magic in SaveStream.magic.items():
+            if header.startswith(magic):
+                return compression
+        return "none"
+
+    @staticmethod
+    def compressor(rawFile, compression):
+        if compression == "gzip":
+            return gzip.GzipFile(fileobj=rawFile, mode="wb", compresslevel=6, mtime=0)
+        elif compression == "lzma":
+            return lzma.LZMAFile(rawFile, "wb")
+        elif compression == "zstd":
+            if not zstandard:
+                raise ValueError("zstd compression requires the zstandard package")
+            return zstandard.ZstdCompressor().stream_writer(rawFile, closefd=False)
+        return rawFile
+
+    @staticmethod
+    def decompressor(rawFile, compression):
+        if compression == "gzip":
+            return gzip.GzipFile(fileobj=rawFile, mode="rb")
+        elif compression == "lzma":
+            return lzma.LZMAFile(rawFile, "rb")
+        elif compression == "zstd":
+            if not zstandard:
+                raise ValueError("zstd compressed save requires the zstandard package")
+            return zstandard.ZstdDecompressor().stream_reader(rawFile, closefd=False)
+        return rawFile
+
+    @staticmethod
+    def dump(saveObj, rawFile, compression = "none"):
+        # json.dump encodes incrementally, so chunks go straight into the compressor
+        stream = SaveStream.compressor(rawFile, compression)
+        text = io.TextIOWrapper(stream, encoding="utf-8")
+        json.dump(saveObj, text)
+        text.flush()
+        text.detach()
+        if stream is not rawFile:
+            stream.close()
+        rawFile.flush()
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as rawFile:
+            compression = SaveStream.detect(rawFile.read(6))
+            rawFile.seek(0)
+            stream = SaveStream.decompressor(rawFile, compression)
+            text = io.TextIOWrapper(stream, encoding="utf-8")
+            try:
+                return json.load(text)
+            finally:
+                text.detach()
+                if stream is not rawFile:
+                    stream.close()
@@ -0,0 +1,118 @@
+import os
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .save_stream import SaveStream
+
+class SaveWriter:
+    listLock = threading.Lock()
+
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.listChanges = OrderedDict()
+        self.lock = threading.Condition()
+        self.worker = None
+        self.writing = False
+        self.error = None
+
+    def write(self, path, saveObj, compression = "none"):
+        # saveObj must be a snapshot; it is serialized later on the worker thread
+        with self.lock:
+            self.pending[path] = (saveObj, compression)
+            self.startWorker()
+
+    def updateList(self, path, key, value):
+        # entries are merged into the list on disk when it is written, None removes one
+        with self.lock:
+            self.listChanges.setdefault(path, {})[key] = value
+            self.startWorker()
+
+    def startWorker(self):
+        if not self.worker:
+            self.worker = threading.Thread(target=self.run, name="SaveWriter", daemon=True)
+            self.worker.start()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if len(self.pending) == 0 and len(self.listChanges) == 0:
+                    self.worker = None
+                    self.lock.notify_all()
+                    return
+                # saves go before the list entries that point at them
+                if len(self.pending) > 0:
+                    path, (saveObj, compression) = self.pending.popitem(last=False)
+                    task = lambda: SaveWriter.writeFile(path, saveObj, compression)
+                else:
+                    path, changes = self.listChanges.popitem(last=False)
+                    task = lambda: SaveWriter.updateListFile(path, changes)
+                self.writing = True
+            try:
+                task()
+            except Exception as e:
+                self.error = e
+            with self.lock:
+                self.writing = False
+                self.lock.notify_all()
+
+    def flush(self):
+        with self.lock:
+            while len(self.pending) > 0 or len(self.listChanges) > 0 or self.writing:
+                self.lock.wait()
+        error = self.error
+        self.error = None
+        return error
+
+    @staticmethod
+    def updateListFile(path, changes):
+        # sessions in other threads and worker processes update the same list, so the read and the replace happen under one lock
+        with SaveWriter.listLock:
+            with open(path + ".lock", "a") as lockFile:
+                if fcntl:
+                    fcntl.flock(lockFile, fcntl.LOCK_EX)
+                try:
+                    with open(path) as listFile:
+                        saveList = json.load(listFile)
+                except (OSError, ValueError):
+                    saveList = {}
+                for key, value in changes.items():
+                    if value is None:
+                        saveList.pop(key, None)
+                    else:
+                        saveList[key] = value
+                SaveWriter.writeFile(path, saveList)
+
+    @staticmethod
+    def writeFile(path, saveObj, compression = "none"):
+        # write to a temp file in the same directory, then rename over the old save
+        directory = os.path.dirname(path)
+        fd, tempPath = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as saveFile:
+                SaveStream.dump(saveObj, saveFile, compression)
+                os.fsync(saveFile.fileno())
+            os.replace(tempPath, path)
+        except:
+            try:
+                os.remove(tempPath)
+            except OSError:
+                pass
+            raise
+
+        try:
+            dirFd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(dirFd)
+        except OSError:
+            pass
+        finally:
+            os.close(dirFd)
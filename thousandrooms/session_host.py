@@ -0,0 +1,450 @@
+import io
+import os
+import sys
+import time
+import uuid
+import zlib
+import select
+import socket
+import threading
+import multiprocessing
+from multiprocessing import reduction
+
+from colored import fore, style
+
+from .game import Game
+from .save_stream import SaveStream
+from .prefetch import Prefetcher
+from .analytics import AnalyticsSink
+from .data_registry import DataRegistry
+from .sampling import GeneratorMismatch
+
+class SessionHandoff(Exception):
+    pass
+
+class SessionClosed(Exception):
+    pass
+
+class SessionOutput:
+    # stands in for sys.stdout in a worker, each session thread prints to its own connection
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def bind(self, stream):
+        self.local.stream = stream
+
+    def getStream(self):
+        return getattr(self.local, "stream", None) or self.default
+
+    def write(self, text):
+        return self.getStream().write(text)
+
+    def flush(self):
+        self.getStream().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.getStream(), name)
+
+class HostedSession:
+    pollInterval = 0.2
+
+    def __init__(self, worker, sessionId, conn, buffered, resumed):
+        self.worker = worker
+        self.sessionId = sessionId
+        self.conn = conn
+        self.buffered = bytearray(buffered)
+        self.resumed = resumed
+        self.handedOff = False
+        self.game = None
+        self.output = conn.makefile("w", encoding="utf-8", errors="replace", newline="\r\n")
+
+    def readLine(self, action = False):
+        self.output.flush()
+        while True:
+            end = self.buffered.find(b"\n")
+            if end >= 0:
+                line = bytes(self.buffered[:end])
+                del self.buffered[:end + 1]
+                return line.decode("utf-8", "replace").strip("\r")
+            # a draining worker lets go of a session at the start of its next turn, or at any prompt once time is up
+            if self.worker.draining and (action or self.worker.isPastDeadline()):
+                raise SessionHandoff()
+            if select.select([self.conn], [], [], HostedSession.pollInterval)[0]:
+                data = self.conn.recv(4096)
+                if not data:
+                    raise SessionClosed()
+                self.buffered += data
+
+    def newGame(self):
+        if self.game:
+            self.game.flushSaves()
+        self.game = Game()
+        self.game.saveId = self.sessionId
+        self.game.inputReader = self.readLine
+        print(f"{style.BOLD}Welcome To The Dungeon of 1000 Rooms!{style.RESET}")
+        print(f"{style.DIM}Your session id is {self.sessionId}, use it to come back to this game.{style.RESET}\n")
+        self.game.startNewGame()
+
+    def loadGame(self):
+        load = SaveStream.load(os.path.join(Game.saveFilePath, self.sessionId))
+        self.game = Game.fromSave(load)
+        self.game.saveId = self.sessionId
+        self.game.inputReader = self.readLine
+
+    def run(self):
+        sys.stdout.bind(self.output)
+        try:
+            if self.resumed:
+                self.loadGame()
+            else:
+                self.newGame()
+            while not self.game.playerQuit:
+                if self.game.restart:
+                    self.game.recordRun("host")
+                    self.newGame()
+                self.game.nextTurn()
+            self.game.recordRun("host")
+            self.game.player.printHistory(self.game.turn)
+            self.output.flush()
+        except SessionHandoff:
+            self.leave(self.worker.handoff)
+            return
+        except (SessionClosed, OSError):
+            self.leave(False)
+            return
+        except GeneratorMismatch as e:
+            print(f"{fore.RED}{e}{style.RESET}")
+            self.output.flush()
+        finally:
+            sys.stdout.bind(None)
+            self.worker.removeSession(self)
+        self.close()
+
+    def isPlaying(self):
+        return self.game is not None and self.game.player is not None and self.game.map is not None and self.game.mode != "gameOver"
+
+    def leave(self, handoff):
+        # the save file is the handoff: whichever worker gets the connection next loads it
+        sys.stdout.bind(io.StringIO())
+        playing = self.isPlaying()
+        if playing:
+            self.game.createSave()
+            self.game.flushSaves()
+        try:
+            if handoff and playing:
+                self.output.write(f"\n{style.DIM}Moving your game to another server...{style.RESET}\n")
+                self.output.flush()
+                self.worker.sendHandoff(self.sessionId, bytes(self.buffered), self.conn)
+                self.handedOff = True
+            elif self.worker.draining:
+                self.output.write(f"\n{fore.RED}The server is shutting down.{style.RESET}\n")
+                if playing:
+                    self.output.write(f"Your game was saved, reconnect with session id {self.sessionId} to continue.\n")
+                self.output.flush()
+        except OSError:
+            pass
+        self.close()
+
+    def close(self):
+        for closer in [self.output.close, self.conn.close]:
+            try:
+                closer()
+            except OSError:
+                pass
+
+class SessionWorker:
+    def __init__(self, slot, pipe):
+        self.slot = slot
+        self.pipe = pipe
+        self.sendLock = threading.Lock()
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.draining = False
+        self.handoff = False
+        self.deadline = 0
+
+    @staticmethod
+    def main(slot, pipe, analyticsPath = None, dataPath = None):
+        # the prefetcher borrows the global random state, which every session in the process shares
+        Prefetcher.enabled = False
+        sys.stdout = SessionOutput(sys.stdout)
+        if dataPath:
+            try:
+                DataRegistry.reload(dataPath)
+            except (OSError, ValueError, KeyError) as e:
+                SessionWorker.reportReloadError(e)
+        if analyticsPath:
+            Game.analytics = AnalyticsSink(analyticsPath, 1)
+        try:
+            SessionWorker(slot, pipe).run()
+        finally:
+            if Game.analytics:
+                Game.analytics.close()
+
+    def run(self):
+        while True:
+            if self.draining and self.getSessionCount() == 0:
+                self.send(("drained",))
+                return
+            try:
+                if not self.pipe.poll(HostedSession.pollInterval):
+                    continue
+                message = self.pipe.recv()
+            except (EOFError, OSError):
+                # the supervisor is gone, save everyone and stop
+                self.startDrain(False, 0)
+                self.pipe = None
+                while self.getSessionCount() > 0:
+                    time.sleep(HostedSession.pollInterval)
+                return
+
+            if message[0] == "session":
+                sessionId, buffered, resumed = message[1:]
+                conn = socket.socket(fileno=reduction.recv_handle(self.pipe))
+                self.startSession(HostedSession(self, sessionId, conn, buffered, resumed))
+            elif message[0] == "drain":
+                self.startDrain(message[1], message[2])
+            elif message[0] == "reload":
+                # sessions keep playing on the live tables while the new ones are read and their caches built
+                DataRegistry.reloadInBackground(message[1], SessionWorker.reportReloadError)
+
+    @staticmethod
+    def reportReloadError(error):
+        print(f"Could not load balance tables: {error}", file=sys.__stderr__)
+
+    def startSession(self, session):
+        with self.lock:
+            self.sessions[session.sessionId] = session
+        threading.Thread(target=session.run, name=f"Session-{session.sessionId}", daemon=True).start()
+
+    def removeSession(self, session):
+        with self.lock:
+            if self.sessions.get(session.sessionId) is session:
+                del self.sessions[session.sessionId]
+        if not session.handedOff:
+            self.send(("ended", session.sessionId))
+
+    def getSessionCount(self):
+        with self.lock:
+            return len(self.sessions)
+
+    def startDrain(self, handoff, timeout):
+        self.handoff = handoff
+        self.deadline = time.monotonic() + timeout
+        self.draining = True
+
+    def isPastDeadline(self):
+        return time.monotonic() >= self.deadline
+
+    def send(self, message):
+        if not self.pipe:
+            return
+        with self.sendLock:
+            try:
+                self.pipe.send(message)
+            except OSError:
+                pass
+
+    def sendHandoff(self, sessionId, buffered, conn):
+        with self.sendLock:
+            self.pipe.send(("handoff", sessionId, buffered))
+            reduction.send_handle(self.pipe, conn.fileno(), os.getppid())
+
+class WorkerHandle:
+    def __init__(self, slot, process, pipe):
+        self.slot = slot
+        self.process = process
+        self.pipe = pipe
+        self.sendLock = threading.Lock()
+        self.draining = False
+        self.drained = threading.Event()
+
+class SessionSupervisor:
+    greetTimeout = 120
+    drainTimeout = 30
+
+    def __init__(self, port, workers = None, host = "127.0.0.1", analyticsPath = None, dataPath = None):
+        self.host = host
+        self.analyticsPath = analyticsPath
+        self.dataPath = dataPath
+        self.port = port
+        self.workerCount = workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context("spawn")
+        self.slots = []
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.sock = None
+        self.running = False
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.slots = [self.startWorker(slot) for slot in range(self.workerCount)]
+        threading.Thread(target=self.acceptClients, name="Front", daemon=True).start()
+
+    def startWorker(self, slot):
+        pipe, childPipe = self.context.Pipe()
+        process = self.context.Process(target=SessionWorker.main, args=(slot, childPipe, self.analyticsPath, self.dataPath), name=f"SessionWorker-{slot}", daemon=True)
+        process.start()
+        childPipe.close()
+        handle = WorkerHandle(slot, process, pipe)
+        threading.Thread(target=self.listenToWorker, args=(handle,), name=f"Worker-{slot}", daemon=True).start()
+        return handle
+
+    def route(self, sessionId):
+        # a session id always maps to the same slot, whichever process is serving it right now
+        return self.slots[zlib.crc32(sessionId.encode()) % len(self.slots)]
+
+    def acceptClients(self):
+        while self.running:
+            try:
+                conn, address = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.greet, args=(conn,), daemon=True).start()
+
+    def greet(self, conn):
+        try:
+            conn.settimeout(SessionSupervisor.greetTimeout)
+            conn.sendall(f"Session id {style.DIM}<Enter> for a new game{style.RESET}: ".encode())
+            buffered = b""
+            while b"\n" not in buffered:
+                data = conn.recv(256)
+                if not data or len(buffered) > 256:
+                    conn.close()
+                    return
+                buffered += data
+            line, buffered = buffered.split(b"\n", 1)
+            sessionId = line.decode("utf-8", "replace").strip()
+            resumed = len(sessionId) > 0
+            if not resumed:
+                sessionId = uuid.uuid4().hex[:12]
+            elif not sessionId.isalnum() or not os.path.exists(os.path.join(Game.saveFilePath, sessionId)):
+                conn.sendall(b"No saved game has that session id.\r\n")
+                conn.close()
+                return
+            conn.settimeout(None)
+            if not self.dispatch(sessionId, conn, buffered, resumed, False):
+                conn.sendall(b"That game is already being played.\r\n")
+                conn.close()
+        except OSError:
+            conn.close()
+
+    def dispatch(self, sessionId, conn, buffered, resumed, handoff):
+        with self.lock:
+            if not self.running:
+                return False
+            # connections for a live session go where it lives, so a save is never played in two places
+            if sessionId in self.sessions and not handoff:
+                return False
+            handle = self.route(sessionId)
+            self.sessions[sessionId] = handle
+        try:
+            with handle.sendLock:
+                handle.pipe.send(("session", sessionId, buffered, resumed))
+                reduction.send_handle(handle.pipe, conn.fileno(), handle.process.pid)
+        except OSError:
+            with self.lock:
+                self.sessions.pop(sessionId, None)
+            return False
+        conn.close()
+        return True
+
+    def listenToWorker(self, handle):
+        while True:
+            try:
+                message = handle.pipe.recv()
+                if message[0] == "handoff":
+                    sessionId, buffered = message[1:]
+                    conn = socket.socket(fileno=reduction.recv_handle(handle.pipe))
+                    conn.setblocking(True)
+                    if not self.dispatch(sessionId, conn, buffered, True, True):
+                        conn.close()
+                elif message[0] == "ended":
+                    with self.lock:
+                        if self.sessions.get(message[1]) is handle:
+                            del self.sessions[message[1]]
+                elif message[0] == "drained":
+                    break
+            except (EOFError, OSError):
+                break
+
+        with self.lock:
+            for sessionId in [s for s, h in self.sessions.items() if h is handle]:
+                del self.sessions[sessionId]
+            crashed = self.running and not handle.draining
+        handle.drained.set()
+        handle.process.join()
+        if crashed:
+            # sessions on a worker that died pick up from their last save when they reconnect
+            self.slots[handle.slot] = self.startWorker(handle.slot)
+
+    def drain(self, handle, handoff, timeout = None):
+        handle.draining = True
+        try:
+            with handle.sendLock:
+                handle.pipe.send(("drain", handoff, SessionSupervisor.drainTimeout if timeout is None else timeout))
+        except OSError:
+            pass
+
+    def restartWorker(self, slot):
+        # the replacement takes the slot first, so sessions handed off by the old process land on it
+        old = self.slots[slot]
+        self.slots[slot] = self.startWorker(slot)
+        self.drain(old, True)
+        old.drained.wait()
+
+    def restartAll(self):
+        for slot in range(len(self.slots)):
+            self.restartWorker(slot)
+
+    def reloadData(self, path = None):
+        # checked here first so a bad table is reported once instead of by every worker
+        path = path or self.dataPath or DataRegistry.dataPath
+        try:
+            DataRegistry.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"{fore.RED}Could not load balance tables: {e}{style.RESET}")
+            return False
+        # workers started from now on load the same tables, so a respawned worker doesn't fall back to the built-in ones
+        self.dataPath = path
+        for handle in list(self.slots):
+            try:
+                with handle.sendLock:
+                    handle.pipe.send(("reload", path))
+            except OSError:
+                pass
+        print(f"{style.DIM}Reloading balance tables from {path}{style.RESET}")
+        return True
+
+    def getSessionCount(self):
+        with self.lock:
+            return len(self.sessions)
+
+    def shutdown(self, timeout = None):
+        with self.lock:
+            self.running = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        for handle in self.slots:
+            self.drain(handle, False, timeout)
+        for handle in self.slots:
+            handle.drained.wait(SessionSupervisor.drainTimeout + 5)
+            if handle.process.is_alive():
+                handle.process.terminate()
+
+    def serveForever(self):
+        print(f"{style.BOLD}Hosting on {self.host}:{self.port} with {len(self.slots)} workers{style.RESET}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print(f"{style.DIM}Saving sessions and shutting down...{style.RESET}")
+            self.shutdown()
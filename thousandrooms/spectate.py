@@ -0,0 +1,184 @@
+import time
+import socket
+import selectors
+import threading
+from collections import deque
+
+class SpectatorClient:
+    def __init__(self, conn, queueSize):
+        self.conn = conn
+        self.frames = deque(maxlen=queueSize)
+        self.sending = None
+        self.events = selectors.EVENT_READ
+        self.dropped = 0
+
+    def offer(self, frame):
+        # a full queue forgets its oldest frame, so a slow viewer skips ahead instead of holding the game up
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+
+    def hasOutput(self):
+        return self.sending is not None or len(self.frames) > 0
+
+    def send(self):
+        # a frame that has started going out is always finished, so the viewer's screen is never torn
+        while self.hasOutput():
+            if self.sending is None:
+                self.sending = memoryview(self.frames.popleft())
+            sent = self.conn.send(self.sending)
+            self.sending = self.sending[sent:]
+            if len(self.sending) > 0:
+                return
+            self.sending = None
+
+class SpectatorServer:
+    queueSize = 2
+    closeTimeout = 1.0
+    clearCode = "\033[2J\033[H"
+
+    def __init__(self, host = "127.0.0.1", port = 0):
+        self.host = host
+        self.port = port
+        self.clients = {}
+        self.lock = threading.Lock()
+        self.latest = None
+        self.sock = None
+        self.selector = None
+        self.wakeRead, self.wakeWrite = None, None
+        self.worker = None
+        self.running = False
+        self.closeDeadline = 0
+        self.framesSent = 0
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen()
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+
+        self.wakeRead, self.wakeWrite = socket.socketpair()
+        self.wakeRead.setblocking(False)
+        self.wakeWrite.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ, "accept")
+        self.selector.register(self.wakeRead, selectors.EVENT_READ, "wake")
+
+        self.running = True
+        self.worker = threading.Thread(target=self.run, name="Spectators", daemon=True)
+        self.worker.start()
+
+    def wake(self):
+        try:
+            self.wakeWrite.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def run(self):
+        # one thread serves every viewer, so the cost of a frame doesn't grow with a thread per connection
+        while self.running or (self.hasPendingOutput() and time.monotonic() < self.closeDeadline):
+            for key, events in self.selector.select(None if self.running else 0.05):
+                if key.data == "accept":
+                    self.acceptClients()
+                elif key.data == "wake":
+                    try:
+                        while self.wakeRead.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                else:
+                    self.serveClient(key.data, events)
+
+            with self.lock:
+                clients = list(self.clients.values())
+            for client in clients:
+                if client.conn in self.clients:
+                    self.watchClient(client)
+
+        for client in list(self.clients.values()):
+            self.removeClient(client)
+
+    def acceptClients(self):
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except (BlockingIOError, OSError):
+                return
+            conn.setblocking(False)
+            client = SpectatorClient(conn, SpectatorServer.queueSize)
+            with self.lock:
+                self.clients[conn] = client
+                if self.latest:
+                    client.offer(self.latest)
+            self.selector.register(conn, selectors.EVENT_READ, client)
+
+    def watchClient(self, client):
+        events = selectors.EVENT_READ
+        with self.lock:
+            if client.hasOutput():
+                events |= selectors.EVENT_WRITE
+        if events != client.events:
+            client.events = events
+            self.selector.modify(client.conn, events, client)
+
+    def serveClient(self, client, events):
+        try:
+            if events & selectors.EVENT_READ:
+                # viewers only watch, so anything readable is either noise or a hang-up
+                if not client.conn.recv(4096):
+                    self.removeClient(client)
+                    return
+            if events & selectors.EVENT_WRITE:
+                with self.lock:
+                    client.send()
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.removeClient(client)
+
+    def removeClient(self, client):
+        with self.lock:
+            self.clients.pop(client.conn, None)
+        try:
+            self.selector.unregister(client.conn)
+        except (KeyError, ValueError):
+            pass
+        try:
+            client.conn.close()
+        except OSError:
+            pass
+
+    def hasPendingOutput(self):
+        with self.lock:
+            return any(client.hasOutput() for client in self.clients.values())
+
+    def getViewerCount(self):
+        with self.lock:
+            return len(self.clients)
+
+    def publish(self, text, turn = None):
+        # encode once and queue the same bytes for every viewer
+        frame = (SpectatorServer.clearCode + text).encode("utf-8", "replace")
+        with self.lock:
+            self.latest = frame
+            for client in self.clients.values():
+                client.offer(frame)
+        self.framesSent += 1
+        self.wake()
+
+    def close(self):
+        if not self.running:
+            return
+        # give viewers a moment to receive the last frame
+        self.closeDeadline = time.monotonic() + SpectatorServer.closeTimeout
+        self.running = False
+        self.wake()
+        self.worker.join()
+        self.selector.close()
+        for sock in [self.sock, self.wakeRead, self.wakeWrite]:
+            try:
+                sock.close()
+            except OSError:
+                pass
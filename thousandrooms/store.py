@@ -1,35 +1,42 @@
+import copy
 import random
+from collections import Counter
 
 from .item import Item
+from .inventory import Inventory
 from .utils import Utils
 
 class Store:
     def __init__(self, level):
         self.level = level
-        self.items = []
+        self.items = Inventory()
         self.maxItems = 30
         self.generateItems()
 
     def generateItems(self):
-        while len(self.items) < self.maxItems:
-            newItem = Item(random.randint(max(self.level - 2, 1), self.level))
-            if newItem.kind:
-                self.items += [newItem]
+        # pick each slot's level weighted by how often a roll at that level finds an item
+        levels = list(range(max(self.level - 2, 1), self.level + 1))
+        chances = [Item.getFoundChance(level) for level in levels]
+        counts = Counter(random.choices(levels, weights=chances, k=self.maxItems - len(self.items)))
+
+        newItems = []
+        for level, count in counts.items():
+            newItems += Item.generateMany(level, count)
+        random.shuffle(newItems)
+        for newItem in newItems:
+            self.items.add(newItem)
 
     def addItem(self, item):
-        if item.kind == "usable":
-            found = False
-            for invItem in self.items:
-                if invItem.id == item.id:
-                    found = True
-                    invItem.stack += 1
-            if not found:
-                self.items.append(item)
-        else:
-            self.items.append(item)
+        if item.kind != "usable" or not self.items.stack(item):
+            self.items.add(item)
 
     def removeItem(self, item):
+        # returns the item that leaves, a usable taken off a stack leaves as a single new item
         if item.kind == "usable" and item.stack > 1:
-            item.stack -= 1
+            self.items.own(item).stack -= 1
+            item = copy.copy(item)
+            item.uid = 0
+            item.stack = 1
         else:
-            self.items.remove(item)
\ No newline at end of file
+            self.items.remove(item)
+        return item
\ No newline at end of file